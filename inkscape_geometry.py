@@ -0,0 +1,1749 @@
+#!/usr/bin/env python
+"""Geometry for the Inkscape extensions: coordinates, intersections, path segments and ellipses.
+
+Doesn't depend on inkex, so it can be used (and imported quickly) outside of Inkscape.
+inkscape_helper re-exports everything defined here.
+"""
+from __future__ import division
+
+from math import *
+from collections import namedtuple, OrderedDict
+from bisect import bisect_right
+from array import array
+import os
+import re
+from timeit import default_timer
+
+
+#Note: keep in mind that SVG coordinates start in the top-left corner i.e. with an inverted y-axis
+
+
+class Instrumentation(object):
+    """Collects phase timings and call counts for one extension run.
+
+    Enabled by Effect.affect when the INKSCAPE_HELPER_INSTRUMENT environment variable or the
+    --instrument option names a report file. When disabled, the hooks in the drawing and
+    geometry code cost a single comparison.
+    """
+
+    def __init__(self, report_file, profile=False):
+        self.report_file = report_file
+        self.phases = OrderedDict()     # name -> [seconds, calls]
+        self.counts = {}
+        self.profiler = None
+        if profile:
+            import cProfile
+            self.profiler = cProfile.Profile()
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def add_time(self, name, seconds):
+        entry = self.phases.setdefault(name, [0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+    def timed(self, name, function):
+        """Wrap function so that its calls are timed as phase name."""
+        def wrapper(*args, **kwargs):
+            with self.phase(name):
+                return function(*args, **kwargs)
+        return wrapper
+
+    def report(self):
+        return OrderedDict([
+            ('phases', OrderedDict((name, {'seconds': s, 'calls': c}) for name, (s, c) in self.phases.items())),
+            ('counts', OrderedDict(sorted(self.counts.items())))])
+
+    def write(self):
+        import json
+        with open(self.report_file, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+        if self.profiler is not None:
+            self.profiler.dump_stats(self.report_file + '.pstats')
+
+class _Phase(object):
+    def __init__(self, instrumentation, name):
+        self.instrumentation, self.name = instrumentation, name
+
+    def __enter__(self):
+        if self.instrumentation is not None:
+            self.start = default_timer()
+        return self
+
+    def __exit__(self, *exc):
+        if self.instrumentation is not None:
+            self.instrumentation.add_time(self.name, default_timer() - self.start)
+        return False
+
+_instrumentation = None   # the active Instrumentation, if any
+
+def phase(name):
+    """Context manager that times a named phase of the effect when instrumentation is enabled."""
+    return _Phase(_instrumentation, name)
+
+
+class IntersectionError(ValueError):
+        """Raised when two lines do not intersect."""
+
+# Status values returned by intersect and intersect_many
+INTERSECTS = 0      # the segments (or lines) intersect
+PARALLEL = 1        # the lines are parallel, there is no intersection point
+OFF_SEGMENT = 2     # the lines intersect outside of (at least one of) the segments
+
+def _on_segment_xy(px, py, sx, sy, ex, ey):
+    """on_segment for plain floats."""
+    px, py, ex, ey = px - sx, py - sy, ex - sx, ey - sy
+    px *= (ex > 0) - (ex < 0)
+    py *= (ey > 0) - (ey < 0)
+    return px >= 0 and px <= abs(ex) and py >= 0 and py <= abs(ey)
+
+def _intersect_xy(x1, y1, x2, y2, x3, y3, x4, y4, on_segments=True):
+    """(status, x, y) of the intersection of the lines through (x1, y1)-(x2, y2) and (x3, y3)-(x4, y4)."""
+    D = (x1 - x2) * (y3 - y4) - (y1 - y2) * (x3 - x4)
+    if D == 0:
+        return PARALLEL, None, None
+    N1 = x1 * y2 - y1 * x2
+    N2 = x3 * y4 - y3 * x4
+    ix = ((x3 - x4) * N1 - (x1 - x2) * N2) / D
+    iy = ((y3 - y4) * N1 - (y1 - y2) * N2) / D
+    if on_segments and not (_on_segment_xy(ix, iy, x1, y1, x2, y2) and _on_segment_xy(ix, iy, x3, y3, x4, y4)):
+        return OFF_SEGMENT, ix, iy
+    return INTERSECTS, ix, iy
+
+def on_segment(pt, start, end):
+    """Check if pt is between start and end. The three points are presumed to be collinear."""
+    return _on_segment_xy(pt.x, pt.y, start.x, start.y, end.x, end.y)
+
+def intersect(s1, e1, s2, e2, on_segments = True):
+    """Non raising version of intersection for use in tight loops.
+
+    Returns (status, point): status is INTERSECTS, PARALLEL (point is None) or OFF_SEGMENT
+    (point is the intersection of the lines through the segments).
+    """
+    status, x, y = _intersect_xy(s1.x, s1.y, e1.x, e1.y, s2.x, s2.y, e2.x, e2.y, on_segments)
+    return status, None if status == PARALLEL else Coordinate(x, y)
+
+def intersect_many(s1, e1, s2, e2, on_segments = True):
+    """Intersect the lines from s1[i] to e1[i] with the lines from s2[i] to e2[i] for all i at once.
+
+    The arguments are CoordinateArrays or sequences of Coordinates. Returns a list of statuses
+    (see intersect) and a CoordinateArray of the points, with nan for parallel lines.
+    """
+    nan = float('nan')
+    coords = [_coordinate_lists(c) for c in (s1, e1, s2, e2)]
+    statuses, xs, ys = [], [], []
+    for x1, y1, x2, y2, x3, y3, x4, y4 in zip(coords[0][0], coords[0][1], coords[1][0], coords[1][1], coords[2][0], coords[2][1], coords[3][0], coords[3][1]):
+        status, x, y = _intersect_xy(x1, y1, x2, y2, x3, y3, x4, y4, on_segments)
+        statuses.append(status)
+        xs.append(nan if x is None else x)
+        ys.append(nan if y is None else y)
+    return statuses, CoordinateArray(xs, ys)
+
+def intersection (s1, e1, s2, e2, on_segments = True):
+    if isinstance(s1, CoordinateArray):  # pairwise intersections of two sets of lines
+        statuses, points = intersect_many(s1, e1, s2, e2, on_segments)
+        for status, pts in zip(statuses, zip(s1, e1, s2, e2)):
+            if status != INTERSECTS:
+                intersection(*pts, on_segments=on_segments)   # raises the appropriate error
+        return points
+    status, x, y = _intersect_xy(s1.x, s1.y, e1.x, e1.y, s2.x, s2.y, e2.x, e2.y, on_segments)
+    if status == PARALLEL:
+        raise IntersectionError("Lines from {0} to {1} and {2} to {3} are parallel".format(s1, e1, s2, e2))
+    I = Coordinate(x, y)
+    if status == OFF_SEGMENT:
+        raise IntersectionError("Intersection {0} is not on line segments [{1} -> {2}] [{3} -> {4}]".format(I, s1, e1, s2, e2))
+    return I
+
+def _segment_intersection_xy(x1, y1, x2, y2, x3, y3, x4, y4):
+    """Intersection (x, y) of the segments (x1, y1)-(x2, y2) and (x3, y3)-(x4, y4), or None. Same rules as intersection."""
+    status, x, y = _intersect_xy(x1, y1, x2, y2, x3, y3, x4, y4)
+    return (x, y) if status == INTERSECTS else None
+
+def _segment_endpoints(segment):
+    """(x1, y1, x2, y2) of a Line or a (start, end) pair."""
+    start, end = (segment.start, segment.end) if isinstance(segment, Line) else segment
+    return start.x, start.y, end.x, end.y
+
+
+class SegmentIndex(object):
+    """Uniform grid over a set of line segments for fast intersection queries.
+
+    Segments are Line objects or (start, end) pairs of Coordinates. Every segment is
+    registered in the grid cells it passes through, so a query only tests the segments
+    that share a cell with it and a long segment costs cells in proportion to its length.
+    """
+
+    def __init__(self, segments, cell_size=None):
+        self.segments = [_segment_endpoints(s) for s in segments]
+        if cell_size is None:
+            extents = [max(abs(x2 - x1), abs(y2 - y1)) for x1, y1, x2, y2 in self.segments]
+            cell_size = sum(extents) / len(extents) if extents else 1
+        self.cell_size = cell_size if cell_size > 0 else 1
+        self.cells = {}
+        for i, segment in enumerate(self.segments):
+            for cell in self._cells(*segment):
+                self.cells.setdefault(cell, []).append(i)
+
+    def _cells(self, x1, y1, x2, y2):
+        """The cells the segment passes through, one column at a time (and the ones it only touches)."""
+        size = self.cell_size
+        eps = 1e-9 * size   # don't miss a cell because of rounding at a cell border
+        if x1 > x2:
+            x1, y1, x2, y2 = x2, y2, x1, y1
+        slope = (y2 - y1) / (x2 - x1) if x2 > x1 else None
+        for ix in range(int(floor((x1 - eps) / size)), int(floor((x2 + eps) / size)) + 1):
+            if slope is None:
+                ya, yb = y1, y2
+            else:
+                ya = y1 + (max(x1, ix * size) - x1) * slope
+                yb = y1 + (min(x2, (ix + 1) * size) - x1) * slope
+            for iy in range(int(floor((min(ya, yb) - eps) / size)), int(floor((max(ya, yb) + eps) / size)) + 1):
+                yield ix, iy
+
+    def candidates(self, x1, y1, x2, y2):
+        """Indices of the segments whose cells overlap the bounding box of the given segment."""
+        found = set()
+        for cell in self._cells(x1, y1, x2, y2):
+            found.update(self.cells.get(cell, ()))
+        return found
+
+    def query(self, start, end):
+        """List of (index, Coordinate) for every indexed segment that intersects the segment from start to end."""
+        return [(j, Coordinate(*pt)) for j, pt in self._query(start.x, start.y, end.x, end.y)]
+
+    def _query(self, x1, y1, x2, y2):
+        hits = []
+        xmin, xmax, ymin, ymax = min(x1, x2), max(x1, x2), min(y1, y2), max(y1, y2)
+        for j in sorted(self.candidates(x1, y1, x2, y2)):
+            x3, y3, x4, y4 = self.segments[j]
+            if max(x3, x4) < xmin or min(x3, x4) > xmax or max(y3, y4) < ymin or min(y3, y4) > ymax:
+                continue
+            pt = _segment_intersection_xy(x1, y1, x2, y2, x3, y3, x4, y4)
+            if pt is not None:
+                hits.append((j, pt))
+        return hits
+
+
+def segment_intersections(segments, others=None, cell_size=None):
+    """All intersecting pairs of segments as a list of (i, j, Coordinate).
+
+    Without others, the segments are tested against each other (i < j). Otherwise every
+    segment i of segments is tested against every segment j of others. Segments are Line
+    objects or (start, end) pairs; touching end points count as intersections, like in
+    intersection, and parallel segments never intersect.
+    """
+    index = SegmentIndex(segments if others is None else others, cell_size)
+    queries = index.segments if others is None else [_segment_endpoints(s) for s in segments]
+    result = []
+    for i, segment in enumerate(queries):
+        for j, (x, y) in index._query(*segment):
+            if others is not None or j > i:
+                result.append((i, j, Coordinate(x, y)))
+    return result
+
+
+# Result of order_toolpaths: the new order as indices into the paths, for every position whether
+# the path is traversed from end to start, and the travel distance in the original and new order
+ToolpathOrder = namedtuple('ToolpathOrder', 'order reversed travel_before travel_after')
+
+class _EndpointGrid(object):
+    """Uniform grid over path end points for nearest neighbour searches that skip finished paths.
+
+    Every entry is (x, y, key) with key = 2 * path index + 1 if the path would be traversed
+    in reverse when it is entered at this point.
+    """
+
+    def __init__(self, entries, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}
+        for entry in entries:
+            self.cells.setdefault(self._cell(entry[0], entry[1]), []).append(entry)
+        ixs = [ix for ix, iy in self.cells] or [0]
+        iys = [iy for ix, iy in self.cells] or [0]
+        self.bounds = min(ixs), max(ixs), min(iys), max(iys)
+
+    def _cell(self, x, y):
+        return int(floor(x / self.cell_size)), int(floor(y / self.cell_size))
+
+    def _ring(self, cx, cy, ring):
+        x0, x1, y0, y1 = self.bounds
+        for ix in range(max(cx - ring, x0), min(cx + ring, x1) + 1):
+            if abs(ix - cx) == ring:
+                for iy in range(max(cy - ring, y0), min(cy + ring, y1) + 1):
+                    yield ix, iy
+            else:
+                for iy in (cy - ring, cy + ring):
+                    if y0 <= iy <= y1:
+                        yield ix, iy
+
+    def nearest(self, x, y, done):
+        """(distance, key) of the nearest entry of a path that isn't done, None if there is none."""
+        cx, cy = self._cell(x, y)
+        x0, x1, y0, y1 = self.bounds
+        last_ring = max(cx - x0, x1 - cx, cy - y0, y1 - cy)
+        best = None
+        ring = 0
+        while ring <= last_ring:
+            for cell in self._ring(cx, cy, ring):
+                entries = self.cells.get(cell)
+                if entries is None:
+                    continue
+                live = [e for e in entries if not done[e[2] >> 1]]
+                if not live:
+                    del self.cells[cell]
+                    continue
+                if len(live) < len(entries):
+                    self.cells[cell] = live
+                for ex, ey, key in live:
+                    dist = hypot(ex - x, ey - y)
+                    if best is None or dist < best[0]:
+                        best = (dist, key)
+            if best is not None and best[0] <= ring * self.cell_size:
+                break   # entries in the next rings are at least that far away
+            ring += 1
+        return best
+
+def _travel(xs, ys, order, reversed_, ends, origin):
+    x, y = origin
+    total = 0
+    for i, rev in zip(order, reversed_):
+        sx, sy = (ends[0][i], ends[1][i]) if rev else (xs[i], ys[i])
+        total += hypot(sx - x, sy - y)
+        x, y = (xs[i], ys[i]) if rev else (ends[0][i], ends[1][i])
+    return total
+
+def order_toolpaths(starts, ends, reversible=True, origin=None, window=8, max_passes=3):
+    """Order paths, given by their start and end points, to reduce the travel between them.
+
+    Starting at origin (default (0, 0)) the nearest unvisited path is found with a grid index,
+    entering reversible paths at either end. For reversible paths a windowed 2-opt then
+    reverses stretches of up to window consecutive paths as long as that shortens the travel,
+    for at most max_passes passes. reversible is a bool or a sequence with one per path.
+    Returns a ToolpathOrder; the travel saved is travel_before - travel_after.
+    """
+    xs, ys = _coordinate_lists(starts)
+    exs, eys = _coordinate_lists(ends)
+    xs, ys, exs, eys = list(xs), list(ys), list(exs), list(eys)
+    n = len(xs)
+    flips = [bool(reversible)] * n if reversible in (True, False) else [bool(r) for r in reversible]
+    ox, oy = (0.0, 0.0) if origin is None else (origin.x, origin.y)
+    before = _travel(xs, ys, range(n), [False] * n, (exs, eys), (ox, oy))
+    if n == 0:
+        return ToolpathOrder([], [], 0, 0)
+
+    entries = [(x, y, 2 * i) for i, (x, y) in enumerate(zip(xs, ys))]
+    entries.extend((x, y, 2 * i + 1) for i, (x, y) in enumerate(zip(exs, eys)) if flips[i])
+    all_x = xs + exs
+    all_y = ys + eys
+    width, height = max(all_x) - min(all_x), max(all_y) - min(all_y)
+    cell_size = 3 * sqrt(width * height / n) or max(width, height) / n or 1
+    grid = _EndpointGrid(entries, cell_size)
+    done = [False] * n
+    order, reversed_ = [], []
+    x, y = ox, oy
+    for _ in range(n):
+        key = grid.nearest(x, y, done)[1]
+        i, rev = key >> 1, bool(key & 1)
+        done[i] = True
+        order.append(i)
+        reversed_.append(rev)
+        x, y = (xs[i], ys[i]) if rev else (exs[i], eys[i])
+
+    # entry (a) and exit (b) points along the tour
+    ax = [exs[i] if rev else xs[i] for i, rev in zip(order, reversed_)]
+    ay = [eys[i] if rev else ys[i] for i, rev in zip(order, reversed_)]
+    bx = [xs[i] if rev else exs[i] for i, rev in zip(order, reversed_)]
+    by = [ys[i] if rev else eys[i] for i, rev in zip(order, reversed_)]
+    for _ in range(max_passes):
+        improved = False
+        for i in range(n):
+            px, py = (bx[i - 1], by[i - 1]) if i else (ox, oy)
+            for j in range(i, min(n, i + window)):
+                if not flips[order[j]]:
+                    break
+                old = hypot(ax[i] - px, ay[i] - py)
+                new = hypot(bx[j] - px, by[j] - py)
+                if j + 1 < n:
+                    old += hypot(ax[j + 1] - bx[j], ay[j + 1] - by[j])
+                    new += hypot(ax[j + 1] - ax[i], ay[j + 1] - ay[i])
+                if new < old - 1e-9:
+                    k = j + 1
+                    order[i:k] = order[i:k][::-1]
+                    reversed_[i:k] = [not r for r in reversed_[i:k][::-1]]
+                    ax[i:k], bx[i:k] = bx[i:k][::-1], ax[i:k][::-1]
+                    ay[i:k], by[i:k] = by[i:k][::-1], ay[i:k][::-1]
+                    improved = True
+        if not improved:
+            break
+    after = _travel(xs, ys, order, reversed_, (exs, eys), (ox, oy))
+    return ToolpathOrder(order, reversed_, before, after)
+
+
+def inner_product(a, b):
+    return a.x * b.x + a.y * b.y
+
+class Coordinate(object):
+    __slots__ = ('x', 'y')
+
+    def __init__(self, x, y):
+        self.x = float(x)
+        self.y = float(y)
+
+    @property
+    def t(self):
+        return atan2(self.y, self.x)
+
+    #@t.setter
+    #def t(self, value):
+
+    @property
+    def r(self):
+        return hypot(self.x, self.y)
+
+    #@r.setter
+    #def r(self, value):
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __str__(self):
+        return "(%f, %f)" % (self.x, self.y)
+
+    def __eq__(self, other):
+        return self.x == other.x and self.y == other.y
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __add__(self, other):
+        return Coordinate(self.x + other.x, self.y + other.y)
+
+    def __sub__(self, other):
+        return Coordinate(self.x - other.x, self.y - other.y)
+
+    def __mul__(self, factor):
+        return Coordinate(self.x * factor, self.y * factor)
+
+    def __rmul__(self, other):
+        return self * other
+
+    def __div__(self, quotient):
+        return Coordinate(self.x / quotient, self.y / quotient)
+
+    def __truediv__(self, quotient):
+        return self.__div__(quotient)
+
+
+class CoordinateArray(object):
+    """A sequence of coordinates stored as two contiguous arrays of doubles.
+
+    Arithmetic works on all points at once and slicing returns a view that shares the
+    underlying storage, so large point clouds don't need one Coordinate object per point.
+    Indexing and iteration yield Coordinate objects.
+    """
+    __slots__ = ('_x', '_y', '_start', '_stop')
+
+    def __init__(self, x=(), y=()):
+        self._x = array('d', x)
+        self._y = array('d', y)
+        if len(self._x) != len(self._y):
+            raise ValueError("x and y need the same number of values, not {0} and {1}".format(len(self._x), len(self._y)))
+        self._start = 0
+        self._stop = len(self._x)
+
+    @classmethod
+    def from_coordinates(cls, coordinates):
+        coordinates = list(coordinates)
+        return cls([c.x for c in coordinates], [c.y for c in coordinates])
+
+    @classmethod
+    def _view(cls, xs, ys, start, stop):
+        view = cls.__new__(cls)
+        view._x, view._y, view._start, view._stop = xs, ys, start, stop
+        return view
+
+    @property
+    def x(self):
+        return self._x if self._start == 0 and self._stop == len(self._x) else self._x[self._start:self._stop]
+
+    @property
+    def y(self):
+        return self._y if self._start == 0 and self._stop == len(self._y) else self._y[self._start:self._stop]
+
+    @property
+    def t(self):
+        return array('d', map(atan2, self.y, self.x))
+
+    @property
+    def r(self):
+        return array('d', map(hypot, self.x, self.y))
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return CoordinateArray(self.x[index], self.y[index])
+            return CoordinateArray._view(self._x, self._y, self._start + start, self._start + max(start, stop))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("CoordinateArray index out of range")
+        return Coordinate(self._x[self._start + index], self._y[self._start + index])
+
+    def __setitem__(self, index, coordinate):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("CoordinateArray index out of range")
+        self._x[self._start + index] = coordinate.x
+        self._y[self._start + index] = coordinate.y
+
+    def __iter__(self):
+        for i in range(self._start, self._stop):
+            yield Coordinate(self._x[i], self._y[i])
+
+    def __repr__(self):
+        return "CoordinateArray([{0}])".format(', '.join(str(c) for c in self))
+
+    def __eq__(self, other):
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def append(self, coordinate):
+        if self._start != 0 or self._stop != len(self._x):
+            raise ValueError("Can't append to a view of a CoordinateArray")
+        self._x.append(coordinate.x)
+        self._y.append(coordinate.y)
+        self._stop += 1
+
+    def _elementwise(self, other, op):
+        if isinstance(other, CoordinateArray):
+            if len(other) != len(self):
+                raise ValueError("CoordinateArrays of length {0} and {1} can't be combined".format(len(self), len(other)))
+            return CoordinateArray(map(op, self.x, other.x), map(op, self.y, other.y))
+        ox, oy = other.x, other.y
+        return CoordinateArray([op(x, ox) for x in self.x], [op(y, oy) for y in self.y])
+
+    def __add__(self, other):
+        return self._elementwise(other, lambda a, b: a + b)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return self._elementwise(other, lambda a, b: a - b)
+
+    def __mul__(self, factor):
+        return CoordinateArray([x * factor for x in self.x], [y * factor for y in self.y])
+
+    def __rmul__(self, other):
+        return self * other
+
+    def __div__(self, quotient):
+        return CoordinateArray([x / quotient for x in self.x], [y / quotient for y in self.y])
+
+    def __truediv__(self, quotient):
+        return self.__div__(quotient)
+
+    def scale(self, sx, sy=None):
+        """Scale all coordinates, optionally with a different factor along the y-axis."""
+        sy = sx if sy is None else sy
+        return CoordinateArray([x * sx for x in self.x], [y * sy for y in self.y])
+
+    def rotate(self, angle, center=None):
+        """Rotate all coordinates over angle around center (default: the origin)."""
+        cx, cy = (0, 0) if center is None else (center.x, center.y)
+        c, s = cos(angle), sin(angle)
+        xs, ys = self.x, self.y
+        return CoordinateArray([cx + c * (x - cx) - s * (y - cy) for x, y in zip(xs, ys)],
+                               [cy + s * (x - cx) + c * (y - cy) for x, y in zip(xs, ys)])
+
+
+def _coordinate_lists(coords):
+    """x and y values of a CoordinateArray or a sequence of Coordinates."""
+    if isinstance(coords, CoordinateArray):
+        return coords.x, coords.y
+    coords = list(coords)
+    return [c.x for c in coords], [c.y for c in coords]
+
+def _polyline_keep(xs, ys, tolerance):
+    """Indices of the vertices that Ramer-Douglas-Peucker keeps for the given tolerance.
+
+    A vertex is only dropped when it is within tolerance of the segment (not the infinite
+    line) between the kept vertices around it, so duplicate and collinear vertices go but
+    reversals stay.
+    """
+    n = len(xs)
+    keep = [False] * n
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        a, b = stack.pop()
+        ax, ay = xs[a], ys[a]
+        dx, dy = xs[b] - ax, ys[b] - ay
+        square = dx * dx + dy * dy
+        worst, index = tolerance, None
+        for i in range(a + 1, b):
+            px, py = xs[i] - ax, ys[i] - ay
+            t = min(max((px * dx + py * dy) / square, 0), 1) if square else 0
+            dist = hypot(px - t * dx, py - t * dy)
+            if dist > worst:
+                worst, index = dist, i
+        if index is not None:
+            keep[index] = True
+            stack.extend([(a, index), (index, b)])
+    return [i for i in range(n) if keep[i]]
+
+def simplify_polyline(coords, tolerance=0):
+    """CoordinateArray with the vertices of the polyline through coords that deviate more than tolerance."""
+    xs, ys = _coordinate_lists(coords)
+    if len(xs) < 3:
+        return CoordinateArray(xs, ys)
+    keep = _polyline_keep(xs, ys, tolerance)
+    return CoordinateArray([xs[i] for i in keep], [ys[i] for i in keep])
+
+
+# Number of operands and which of them are x (x) or y (y) coordinates that move with the current point
+_PATH_OPERANDS = {'m': 'xy', 'l': 'xy', 'h': 'x', 'v': 'y', 'c': 'xyxyxy', 's': 'xyxy', 'q': 'xyxy', 't': 'xy', 'a': '-----xy', 'z': ''}
+
+
+CacheInfo = namedtuple('CacheInfo', 'hits misses maxsize currsize')
+
+class LRUCache(object):
+    """Size bounded mapping that evicts the least recently used entry, with hit and miss counters."""
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key, compute):
+        """Value stored under key, calling compute() to create it on a miss."""
+        try:
+            value = self._data.pop(key)
+            self.hits += 1
+        except KeyError:
+            value = compute()
+            self.misses += 1
+            if len(self._data) >= self.maxsize > 0:
+                self._data.popitem(last=False)
+        if self.maxsize > 0:
+            self._data[key] = value     # (re)insert as most recently used
+        return value
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._data))
+
+    def clear(self):
+        self._data.clear()
+        self.hits = self.misses = 0
+
+class GeometryCache(LRUCache):
+    """LRUCache for computed geometry, keyed by the inputs of the computation.
+
+    When GeometryCache.directory is set (for all instances at once) entries are also stored
+    there, in a file named after name and a hash of the key, so a rerun of an effect with
+    partly changed parameters only recomputes the geometry whose inputs changed.
+    Cached values are shared and must not be modified.
+    """
+    directory = None
+
+    def __init__(self, name, maxsize=128):
+        LRUCache.__init__(self, maxsize)
+        self.name = name
+
+    def filename(self, key):
+        import hashlib
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, '{0}-{1}.pickle'.format(self.name, digest))
+
+    def _load_or_compute(self, key, compute):
+        import pickle
+        filename = self.filename(key)
+        try:
+            with open(filename, 'rb') as f:
+                return pickle.load(f)
+        except Exception:   # missing, truncated or written by an incompatible version
+            pass
+        value = compute()
+        try:
+            temp = '{0}.{1}'.format(filename, os.getpid())
+            with open(temp, 'wb') as f:
+                pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+            if os.name == 'nt' and os.path.exists(filename):
+                os.remove(filename)     # rename doesn't replace on Windows
+            os.rename(temp, filename)
+        except (IOError, OSError):
+            pass
+        return value
+
+    def get(self, key, compute):
+        if self.directory is None:
+            return LRUCache.get(self, key, compute)
+        return LRUCache.get(self, key, lambda : self._load_or_compute(key, compute))
+
+
+PathPoint = namedtuple('PathPoint', 't coord tangent curvature c_dist')
+
+# Batched counterpart of PathPoint: every field is a list with one entry per t
+PathPoints = namedtuple('PathPoints', 't x y dx dy curvature c_dist')
+
+def _adaptive_arc_length(point, t0, t1, tolerance, min_depth=3, max_depth=24):
+    """Sample the curve point(t) on [t0, t1] until its polyline length is within tolerance of the arc length.
+
+    An interval is split in two until the two half chords are no more than its share of
+    the tolerance longer than the full chord. Returns the sampled t values, the
+    cumulative polyline distance at each of them and the estimated error of the total
+    length, which never exceeds tolerance.
+    """
+    span = t1 - t0
+    ts, dists = [t0], [0]
+    error = 0
+    ta, (xa, ya) = t0, point(t0)
+    stack = [(t1, point(t1), 0)]    # right end points of the intervals still to be processed
+    while stack:
+        tb, (xb, yb), depth = stack[-1]
+        tm = (ta + tb) / 2
+        xm, ym = point(tm)
+        first, second = hypot(xm - xa, ym - ya), hypot(xb - xm, yb - ym)
+        excess = first + second - hypot(xb - xa, yb - ya)
+        if depth < max_depth and (depth < min_depth or excess > tolerance * (tb - ta) / span):
+            stack[-1] = (tb, (xb, yb), depth + 1)
+            stack.append((tm, (xm, ym), depth + 1))
+        else:
+            stack.pop()
+            ts.extend((tm, tb))
+            dists.extend((dists[-1] + first, dists[-1] + first + second))
+            error += excess
+            ta, xa, ya = tb, xb, yb
+    return ts, dists, error
+
+def _uniform_arc_length_error(x, y):
+    """Estimated length error of the polyline through an even number of uniformly sampled intervals."""
+    error = 0
+    for i in range(0, len(x) - 2, 2):
+        error += hypot(x[i + 1] - x[i], y[i + 1] - y[i]) + hypot(x[i + 2] - x[i + 1], y[i + 2] - y[i + 1]) - hypot(x[i + 2] - x[i], y[i + 2] - y[i])
+    return error
+
+def _interpolate(xs, ys, x):
+    """Linear interpolation in the table ys(xs), xs sorted ascending."""
+    i = min(max(bisect_right(xs, x) - 1, 0), len(xs) - 2)
+    step = xs[i + 1] - xs[i]
+    if x == xs[i] or step == 0:
+        return ys[i]
+    return ys[i] + (x - xs[i]) / step * (ys[i + 1] - ys[i])
+
+
+def _pathpoint_list(pts):
+    """Convert a PathPoints tuple of lists to a list of PathPoint tuples."""
+    return [PathPoint(t, Coordinate(x, y), Coordinate(dx, dy), k, d) for t, x, y, dx, dy, k, d in zip(*pts)]
+
+
+class PathSegment():
+
+    def __init__(self):
+        raise NotImplementedError
+
+    @property
+    def length(self):
+        raise NotImplementedError
+
+    def subdivide(self, part_length):
+        raise NotImplementedError
+
+    def coordinates(self, ts):
+        """CoordinateArray with the points on the segment for every t in ts."""
+        raise NotImplementedError
+
+    def evaluate(self, ts):
+        """PathPoints with positions, tangents, curvatures and cumulative distances for every t in ts."""
+        raise NotImplementedError
+
+    def ts_at_lengths(self, lengths):
+        """t values at the given distances from the start of the segment."""
+        raise NotImplementedError
+
+    def t_at_length(self, length):
+        return self.ts_at_lengths([length])[0]
+
+    subdivisionCache = GeometryCache('subdivide', 1024)    # shared by all segments
+
+    def cache_key(self):
+        """Hashable description of the segment's inputs, None if results can't be cached."""
+        return None
+
+    def subdivide_cached(self, part_length, start_offset=0):
+        """subdivide through the subdivision cache; the returned points are shared and must not be modified."""
+        key = self.cache_key()
+        if key is None:
+            return self.subdivide(part_length, start_offset)
+        return self.subdivisionCache.get(key + (part_length, start_offset), lambda : self.subdivide(part_length, start_offset))
+
+    def subdivide_curvature(self, max_deviation, max_length=None, thickness=0, min_depth=2, max_depth=16):
+        """Subdivide with a spacing that depends on the curvature, returns a list of PathPoints.
+
+        An interval is halved until the chord between its end points deviates less than
+        max_deviation from a circle with the largest curvature found at its ends and its middle,
+        and is no longer than max_length. With a thickness the deviation is measured on the inner
+        face of material with that thickness bent along the segment, i.e. at a radius that is
+        thickness smaller, and a ValueError is raised where the segment bends tighter than the
+        thickness allows. Points are dense where the curvature is high and sparse elsewhere.
+        All midpoints of one refinement level are evaluated in a single batch.
+        """
+        samples = {}
+        def sample(ts):
+            pts = self.evaluate(ts)
+            for t, x, y, k in zip(pts.t, pts.x, pts.y, pts.curvature):
+                samples[t] = (x, y, abs(k))
+        sample([0, 0.5, 1])
+        pending, accepted = [(0, 1, 0)], []
+        while pending:
+            split = []
+            for a, b, depth in pending:
+                m = (a + b) / 2
+                (xa, ya, ka), (xm, ym, km), (xb, yb, kb) = samples[a], samples[m], samples[b]
+                chord = hypot(xb - xa, yb - ya)
+                k_max = max(ka, km, kb)
+                if k_max > 0:
+                    radius = 1 / k_max - thickness
+                    if radius <= 0:
+                        raise ValueError("Material of thickness {0} can't be bent to a radius of {1}".format(thickness, 1 / k_max))
+                    deviation = chord**2 / (8 * radius)
+                else:
+                    deviation = 0
+                if depth < max_depth and (depth < min_depth or deviation > max_deviation or (max_length is not None and chord > max_length)):
+                    split.extend([(a, m, depth + 1), (m, b, depth + 1)])
+                else:
+                    accepted.append(a)
+            sample([(a + b) / 2 for a, b, depth in split])
+            pending = split
+        return _pathpoint_list(self.evaluate(sorted(accepted) + [1]))
+
+
+class Line(PathSegment):
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+
+    @property
+    def length(self):
+        return (self.end - self.start).r
+
+    def cache_key(self):
+        return ('Line', self.start.x, self.start.y, self.end.x, self.end.y)
+
+    def subdivide(self, part_length, start_offset=0): # note: start_offset should be smaller than part_length
+        nr_parts = int((self.length - start_offset) // part_length)
+        k_o = start_offset / self.length
+        k2t = lambda k : k_o + k * part_length / self.length
+        pp = lambda t : PathPoint(t, self.start + t * (self.end - self.start), self.end - self.start, 0, t * self.length)
+        points = [pp(k2t(k)) for k in range(nr_parts + 1)]
+        return(points, self.length - points[-1].c_dist)
+
+    def coordinates(self, ts):
+        sx, sy = self.start.x, self.start.y
+        dx, dy = self.end.x - sx, self.end.y - sy
+        return CoordinateArray([sx + t * dx for t in ts], [sy + t * dy for t in ts])
+
+    def evaluate(self, ts):
+        ts = list(ts)
+        c = self.coordinates(ts)
+        d = self.end - self.start
+        return PathPoints(ts, list(c.x), list(c.y), [d.x] * len(ts), [d.y] * len(ts), [0] * len(ts), [t * self.length for t in ts])
+
+    def ts_at_lengths(self, lengths):
+        length = self.length
+        return [min(l / length, 1) if length > 0 else 0 for l in lengths]
+
+
+def _bernstein_weights(order, ts):
+    """Bernstein basis weights of the curve, its first and its second derivative for every t in ts.
+
+    The weights only depend on t, so they can be shared by all curves of the same order.
+    """
+    weights = []
+    if order == 2:
+        for t in ts:
+            mt = 1 - t
+            weights.append(((mt**2, 2 * mt * t, t**2), (2 * mt, 2 * t), (2,)))
+    elif order == 3:
+        for t in ts:
+            mt = 1 - t
+            weights.append(((mt**3, 3 * mt**2 * t, 3 * mt * t**2, t**3), (3 * mt**2, 6 * mt * t, 3 * t**2), (6 * mt, 6 * t)))
+    else:
+        raise ValueError("Only quadratic and cubic bezier curves are supported, not order {0}".format(order))
+    return weights
+
+def _control_polygons(P):
+    """x and y values of the control points and of their first and second differences."""
+    if isinstance(P, CoordinateArray):
+        px, py = list(P.x), list(P.y)
+    else:
+        px = [p.x for p in P]
+        py = [p.y for p in P]
+    dx = [b - a for a, b in zip(px, px[1:])]
+    dy = [b - a for a, b in zip(py, py[1:])]
+    ddx = [b - a for a, b in zip(dx, dx[1:])]
+    ddy = [b - a for a, b in zip(dy, dy[1:])]
+    return px, py, dx, dy, ddx, ddy
+
+def _bezier_eval(polygons, weights):
+    """Positions, derivatives and curvatures of one curve for precomputed Bernstein weights."""
+    px, py, dx, dy, ddx, ddy = polygons
+    x, y, bdx, bdy, k = [], [], [], [], []
+    for w, wd, wdd in weights:
+        x.append(sum(a * b for a, b in zip(w, px)))
+        y.append(sum(a * b for a, b in zip(w, py)))
+        tx = sum(a * b for a, b in zip(wd, dx))
+        ty = sum(a * b for a, b in zip(wd, dy))
+        bdx.append(tx)
+        bdy.append(ty)
+        speed = hypot(tx, ty)
+        if speed == 0:
+            k.append(float('inf'))
+        else:
+            k.append((tx * sum(a * b for a, b in zip(wdd, ddy)) - ty * sum(a * b for a, b in zip(wdd, ddx))) / speed**3)
+    return x, y, bdx, bdy, k
+
+def evaluate_beziers(curves, ts):
+    """Evaluate many bezier curves at the same t values in one pass.
+
+    Returns a list with a PathPoints tuple for each curve. The Bernstein weights are
+    computed only once per order, so this is considerably faster than evaluating the
+    curves one by one when a lot of curves are flattened.
+    """
+    ts = list(ts)
+    weights = {}
+    result = []
+    for curve in curves:
+        if curve.order not in weights:
+            weights[curve.order] = _bernstein_weights(curve.order, ts)
+        x, y, dx, dy, k = _bezier_eval(curve.polygons, weights[curve.order])
+        result.append(PathPoints(ts, x, y, dx, dy, k, curve.dists_at_t(ts)))
+    return result
+
+
+class BezierCurve(PathSegment):
+    nr_points = 10  # used for the arc length table when no tolerance is given
+    tableCache = GeometryCache('BezierCurve', 256)   # arc length tables, shared by all instances
+    def __init__(self, P, tolerance=None): # number of points is limited to 3 or 4, either as a list of Coordinates or a CoordinateArray
+        """With a tolerance the arc length table is refined adaptively until the length is accurate to within tolerance."""
+        if _instrumentation is not None:
+            _instrumentation.count('BezierCurve')
+        self.P = P if isinstance(P, CoordinateArray) else list(P)
+        self.order = len(self.P) - 1
+        self.polygons = _control_polygons(self.P)
+        self.tolerance = tolerance
+        key = self.cache_key() + (self.nr_points if tolerance is None else None, tolerance)
+        self.ts, self.distances, self.length_error = self.tableCache.get(key, self._arc_length_table)
+        self._length = self.distances[-1]
+
+    def _arc_length_table(self):
+        """(ts, cumulative distances for each t, length error)"""
+        if self.tolerance is None:
+            ts = [i / self.nr_points for i in range(self.nr_points + 1)]
+            x, y = _bezier_eval(self.polygons, _bernstein_weights(self.order, ts))[:2]
+            distances = [0]
+            for i in range(self.nr_points):
+                distances.append(distances[-1] + hypot(x[i] - x[i + 1], y[i] - y[i + 1]))
+            return ts, distances, _uniform_arc_length_error(x, y)
+        point = lambda t : tuple(v[0] for v in _bezier_eval(self.polygons, _bernstein_weights(self.order, [t]))[:2])
+        return _adaptive_arc_length(point, 0, 1, self.tolerance)
+
+    def cache_key(self):
+        return ('BezierCurve',) + tuple(self.polygons[0]) + tuple(self.polygons[1])
+
+    @classmethod
+    def quadratic(cls, start, c, end):
+        return cls([start, c, end])
+
+    @classmethod
+    def cubic(cls, start, c1, c2, end):
+        return cls([start, c1, c2, end])
+
+    @property
+    def length(self):
+        return self._length
+
+    def B(self, t):
+        """Point on the curve at t."""
+        x, y = _bezier_eval(self.polygons, _bernstein_weights(self.order, [t]))[:2]
+        return Coordinate(x[0], y[0])
+
+    def tangent(self, t):
+        """First derivative of the curve at t."""
+        dx, dy = _bezier_eval(self.polygons, _bernstein_weights(self.order, [t]))[2:4]
+        return Coordinate(dx[0], dy[0])
+
+    def curvature(self, t):
+        """Signed curvature of the curve at t."""
+        return _bezier_eval(self.polygons, _bernstein_weights(self.order, [t]))[4][0]
+
+    def coordinates(self, ts):
+        x, y = _bezier_eval(self.polygons, _bernstein_weights(self.order, ts))[:2]
+        return CoordinateArray(x, y)
+
+    def evaluate(self, ts):
+        """Positions, tangents, curvatures and cumulative distances for all t in ts as a PathPoints tuple of lists."""
+        return evaluate_beziers([self], ts)[0]
+
+    def subdivide(self, part_length, start_offset=0):
+        nr_parts = int((self.length - start_offset) / part_length + 10E-10)
+        lengths = [start_offset + k * part_length for k in range(nr_parts + 1)]
+        points = _pathpoint_list(self.evaluate(self.ts_at_lengths(lengths)))
+        return(points, self.length - points[-1].c_dist)
+
+    def pathpoint_at_t(self, t):
+        """pathpoint on the curve from t=0 to point at t."""
+        t, x, y, dx, dy, k, d = [field[0] for field in self.evaluate([t])]
+        return PathPoint(t, Coordinate(x, y), Coordinate(dx, dy), k, d)
+
+    def dists_at_t(self, ts):
+        """Interpolated cumulative distances from t=0 for every t in ts (accurate to within length_error)."""
+        return [_interpolate(self.ts, self.distances, t) for t in ts]
+
+    def t_at_length(self, length):
+        """interpolated t where the curve is at the given length (accurate to within length_error)"""
+        return self.ts_at_lengths([length])[0]
+
+    def ts_at_lengths(self, lengths):
+        """Interpolated t values for every length in lengths."""
+        return [1 if length >= self.length else _interpolate(self.distances, self.ts, length) for length in lengths]
+
+
+def _carlson_rf(x, y, z, errtol=1e-4):
+    """Carlson's symmetric elliptic integral of the first kind R_F(x, y, z)."""
+    while True:
+        sx, sy, sz = sqrt(x), sqrt(y), sqrt(z)
+        lam = sx * (sy + sz) + sy * sz
+        x, y, z = (x + lam) / 4, (y + lam) / 4, (z + lam) / 4
+        ave = (x + y + z) / 3
+        dx, dy, dz = (ave - x) / ave, (ave - y) / ave, (ave - z) / ave
+        if max(abs(dx), abs(dy), abs(dz)) <= errtol:
+            break
+    e2 = dx * dy - dz * dz
+    e3 = dx * dy * dz
+    return (1 + (e2 / 24 - 0.1 - 3 * e3 / 44) * e2 + e3 / 14) / sqrt(ave)
+
+def _carlson_rd(x, y, z, errtol=1e-4):
+    """Carlson's symmetric elliptic integral of the second kind R_D(x, y, z)."""
+    total, fac = 0, 1
+    while True:
+        sx, sy, sz = sqrt(x), sqrt(y), sqrt(z)
+        lam = sx * (sy + sz) + sy * sz
+        total += fac / (sz * (z + lam))
+        fac /= 4
+        x, y, z = (x + lam) / 4, (y + lam) / 4, (z + lam) / 4
+        ave = (x + y + 3 * z) / 5
+        dx, dy, dz = (ave - x) / ave, (ave - y) / ave, (ave - z) / ave
+        if max(abs(dx), abs(dy), abs(dz)) <= errtol:
+            break
+    ea, eb = dx * dy, dz * dz
+    ec, ed = ea - eb, ea - 6 * eb
+    ee = ed + 2 * ec
+    c1, c2, c3, c4 = 3 / 14, 1 / 6, 9 / 22, 3 / 26
+    return 3 * total + fac * (1 + ed * (-c1 + c3 / 4 * ed - 1.5 * c4 * dz * ee) + dz * (c2 * ee + dz * (-c3 * ec + dz * c4 * ea))) / (ave * sqrt(ave))
+
+def elliptic_e(phi, m, complete=None):
+    """Incomplete elliptic integral of the second kind E(phi | m), for any phi and 0 <= m < 1.
+
+    complete can pass in a precomputed E(pi/2 | m) when many values for the same m are needed.
+    """
+    n = floor(phi / pi + 0.5)
+    psi = phi - n * pi  # in [-pi/2, pi/2]
+    s, c = sin(psi), cos(psi)
+    q = 1 - m * s * s
+    e = s * _carlson_rf(c * c, q, 1) - m / 3 * s ** 3 * _carlson_rd(c * c, q, 1)
+    if n:
+        if complete is None:
+            complete = _carlson_rf(0, 1 - m, 1) - m / 3 * _carlson_rd(0, 1 - m, 1)
+        e += 2 * n * complete
+    return e
+
+
+EllipsePoint = namedtuple('EllipsePoint', 'angle coord cDist')
+
+# Immutable arc length table shared by all Ellipse instances with the same size and resolution
+EllipseTable = namedtuple('EllipseTable', 'angles xs ys cDists lengthError')
+
+def _ellipse_table(w, h, nrPoints, tolerance):
+    """Arc length table of the full ellipse, mirrored from the first quadrant."""
+    if tolerance is None:
+        quarterSteps = -(-nrPoints // 4)
+        angleStep = pi / 2 / quarterSteps
+        angles = [i * angleStep for i in range(quarterSteps + 1)]
+        xs = [w / 2 * cos(a) for a in angles]
+        ys = [h / 2 * sin(a) for a in angles]
+        dists = [0]
+        for i in range(quarterSteps):
+            dists.append(dists[-1] + hypot(xs[i] - xs[i + 1], ys[i] - ys[i + 1]))
+        error = _uniform_arc_length_error(xs, ys)
+    else:
+        point = lambda a : (w / 2 * cos(a), h / 2 * sin(a))
+        angles, dists, error = _adaptive_arc_length(point, 0, pi / 2, tolerance / 4, min_depth=2)
+        xs, ys = zip(*[point(a) for a in angles])
+    quarter = dists[-1]
+    rev = lambda seq : list(reversed(seq))[1:]  # mirrored quadrant, without the shared end point
+    allAngles = list(angles) + [pi - a for a in rev(angles)] + [pi + a for a in angles[1:]] + [2 * pi - a for a in rev(angles)]
+    allXs = list(xs) + [-x for x in rev(xs)] + [-x for x in xs[1:]] + rev(xs)
+    allYs = list(ys) + rev(ys) + [-y for y in ys[1:]] + [-y for y in rev(ys)]
+    allDists = list(dists) + [2 * quarter - d for d in rev(dists)] + [2 * quarter + d for d in dists[1:]] + [4 * quarter - d for d in rev(dists)]
+    return EllipseTable(tuple(allAngles), tuple(allXs), tuple(allYs), tuple(allDists), 4 * error)
+
+
+class Ellipse():
+    nrPoints = 1000 #used for piecewise linear circumference calculation (ellipse circumference is tricky to calculate)
+    # approximate circumfere: c = pi * (3 * (a + b) - sqrt(10 * a * b + 3 * (a ** 2 + b ** 2)))
+    tableCache = GeometryCache('Ellipse', 64)   # process wide, shared by all instances
+
+    def __init__(self, w, h, tolerance=None):
+        """With a tolerance the arc length table is refined adaptively until the circumference is accurate to within tolerance.
+
+        Instances with the same size and resolution share their (immutable) arc length table.
+        """
+        if _instrumentation is not None:
+            _instrumentation.count('Ellipse')
+        self.h = h
+        self.w = w
+        self.tolerance = tolerance
+        #note: the render angle (ra) corresponds to the angle from the ellipse center (ca) according to:
+        # ca = atan(w/h * tan(ra))
+        key = (float(w), float(h), self.nrPoints if tolerance is None else None, tolerance)
+        self.table = self.tableCache.get(key, lambda : _ellipse_table(w, h, self.nrPoints, tolerance))
+        self.angles = self.table.angles
+        self.cDists = self.table.cDists
+        self.lengthError = self.table.lengthError
+        if tolerance is None:
+            self.angleStep = self.angles[1]
+        self.circumference = self.cDists[-1]
+        self._ellData = None
+        self._completeCache = (None, None)  # (m, E(pi/2 | m)) used by arcLength
+        #inkex.debug("circ: %d" % self.circumference)
+
+    @classmethod
+    def cache_info(cls):
+        """Hits and misses of the shared arc length table cache."""
+        return cls.tableCache.info()
+
+    @property
+    def ellData(self):
+        """(angle, coordinate, cumulative distance from angle = 0) for every entry of the arc length table"""
+        if self._ellData is None:
+            t = self.table
+            self._ellData = [EllipsePoint(a, Coordinate(x, y), d) for a, x, y, d in zip(t.angles, t.xs, t.ys, t.cDists)]
+        return self._ellData
+
+    def rAngle(self, a):
+        """Convert an angle measured from ellipse center to the angle used to generate ellData (used for lookups)"""
+        cf = 0
+        if a > pi / 2:
+            cf = pi
+        if a > 3 * pi / 2:
+            cf = 2 * pi
+        return atan(self.w / self.h * tan(a)) + cf
+
+    def coordinateFromAngle(self, angle):
+        """Coordinate of the point at angle."""
+        return Coordinate(self.w / 2 * cos(angle), self.h / 2 * sin(angle))
+
+    def coordinatesFromAngles(self, angles):
+        """CoordinateArray with the points at all angles."""
+        return CoordinateArray([self.w / 2 * cos(a) for a in angles], [self.h / 2 * sin(a) for a in angles])
+
+    def normalsFromAngles(self, angles):
+        """CoordinateArray with the outward unit normals at all angles.
+
+        Computed from the derivative (-w/2 sin(a), h/2 cos(a)) of the parametric ellipse, so
+        there are no special cases at the axes.
+        """
+        a, b = self.w / 2, self.h / 2
+        xs, ys = [], []
+        for angle in angles:
+            nx, ny = b * cos(angle), a * sin(angle)
+            length = hypot(nx, ny)
+            xs.append(nx / length)
+            ys.append(ny / length)
+        return CoordinateArray(xs, ys)
+
+    def notchCoordinates(self, angles, notchHeight):
+        """CoordinateArray with the points at notchHeight outside the ellipse (inside when negative)
+        along the normal at all angles. notchHeight is a number or a sequence with one per angle."""
+        angles = list(angles)
+        try:
+            heights = list(notchHeight)
+        except TypeError:
+            heights = [notchHeight] * len(angles)
+        a, b = self.w / 2, self.h / 2
+        xs, ys = [], []
+        for angle, height in zip(angles, heights):
+            c, s = cos(angle), sin(angle)
+            scale = height / hypot(b * c, a * s)
+            xs.append(a * c + b * c * scale)
+            ys.append(b * s + a * s * scale)
+        return CoordinateArray(xs, ys)
+
+    def notchCoordinate(self, angle, notchHeight):
+        """Coordinate for a notch at the given angle. The notch is perpendicular to the ellipse."""
+        return self.notchCoordinates([angle], notchHeight)[0]
+
+
+    def arcLength(self, angle):
+        """Exact distance along the ellipse from angle 0 to the point at (render) angle, measured in CCW sense."""
+        a, b = self.w / 2, self.h / 2
+        if b >= a:
+            m = 1 - (a / b) ** 2
+            return b * elliptic_e(angle, m, self._completeE(m))
+        m = 1 - (b / a) ** 2
+        complete = self._completeE(m)
+        return a * (complete - elliptic_e(pi / 2 - angle, m, complete))
+
+    def _completeE(self, m):
+        if self._completeCache[0] != m:
+            self._completeCache = (m, elliptic_e(pi / 2, m))
+        return self._completeCache[1]
+
+    def anglesFromDists(self, startAngle, relDists, tolerance=1e-12):
+        """Render angles of all points at the distances relDists from startAngle, measured in CCW sense.
+
+        Solves arcLength(angle) = distance exactly (to within tolerance) with Newton's method,
+        starting from the arc length table, for all distances at once. Unlike angleFromDist the
+        distances are measured along the true ellipse rather than along the polyline.
+        """
+        circumference = self.arcLength(2 * pi)
+        startDist = self.arcLength(self.rAngle(startAngle))
+        return self.anglesAtArcLengths([(startDist + d) % circumference for d in relDists], tolerance)
+
+    def anglesAtArcLengths(self, targets, tolerance=1e-12):
+        """Render angles where arcLength(angle) equals each of the targets, which may be negative or exceed the circumference."""
+        a, b = self.w / 2, self.h / 2
+        circumference = self.arcLength(2 * pi)
+        turns = [floor(d / circumference) for d in targets]
+        targets = [d - n * circumference for d, n in zip(targets, turns)]
+        scale = self.circumference / circumference
+        angles = [_interpolate(self.cDists, self.angles, d * scale) for d in targets]
+        todo = list(range(len(targets)))
+        for iteration in range(16):
+            if not todo:
+                break
+            remaining = []
+            for i in todo:
+                phi = angles[i]
+                step = (self.arcLength(phi) - targets[i]) / hypot(a * sin(phi), b * cos(phi))
+                angles[i] = phi - step
+                if abs(step) > tolerance:
+                    remaining.append(i)
+            todo = remaining
+        return [phi + 2 * pi * n for phi, n in zip(angles, turns)]
+
+    def distFromAngles(self, a1, a2):
+        """Distance accross the surface from point at angle a2 to point at angle a2. Measured in CCW sense.
+
+        The result is accurate to within lengthError.
+        """
+        d1 = _interpolate(self.angles, self.cDists, self.rAngle(a1))
+        d2 = _interpolate(self.angles, self.cDists, self.rAngle(a2))
+        if a1 <= a2:
+            len = d2 - d1
+        else:
+            len = self.circumference + d2 - d1
+        return len
+
+    def angleFromDist(self, startAngle, relDist):
+        """Returns the angle that you get when starting at startAngle and moving a distance (dist) in CCW direction
+
+        The distance is measured with an accuracy of lengthError.
+        """
+        absDist = relDist + _interpolate(self.angles, self.cDists, self.rAngle(startAngle))
+
+        if absDist > self.circumference:  # wrap around zero angle
+            absDist -= self.circumference
+
+        return _interpolate(self.cDists, self.angles, absDist)
+
+
+class EllipticArc(PathSegment):
+    """Arc of an ellipse with radii rx, ry around center, from (render) angle start to angle end.
+
+    The angles are measured in the rotated frame of the ellipse; end < start gives a clockwise
+    arc. Lengths are exact (see Ellipse.arcLength).
+    """
+
+    def __init__(self, center, rx, ry, start, end, rotation=0):
+        self.center = center
+        self.rx, self.ry = rx, ry
+        self.start, self.end = start, end
+        self.rotation = rotation
+        self.ellipse = Ellipse(2 * rx, 2 * ry)
+        self._startLength = self.ellipse.arcLength(start)
+        self._length = abs(self.ellipse.arcLength(end) - self._startLength)
+
+    @property
+    def length(self):
+        return self._length
+
+    def cache_key(self):
+        return ('EllipticArc', self.center.x, self.center.y, self.rx, self.ry, self.start, self.end, self.rotation)
+
+    def _angles(self, ts):
+        return [self.start + t * (self.end - self.start) for t in ts]
+
+    def coordinates(self, ts):
+        pts = self.evaluate(ts)
+        return CoordinateArray(pts.x, pts.y)
+
+    def evaluate(self, ts):
+        ts = list(ts)
+        sweep = self.end - self.start
+        cr, sr = cos(self.rotation), sin(self.rotation)
+        cx, cy, rx, ry = self.center.x, self.center.y, self.rx, self.ry
+        x, y, dx, dy, k, dists = [], [], [], [], [], []
+        for t, a in zip(ts, self._angles(ts)):
+            ex, ey = rx * cos(a), ry * sin(a)
+            tx, ty = -rx * sin(a) * sweep, ry * cos(a) * sweep
+            x.append(cx + cr * ex - sr * ey)
+            y.append(cy + sr * ex + cr * ey)
+            dx.append(cr * tx - sr * ty)
+            dy.append(sr * tx + cr * ty)
+            speed = hypot(rx * sin(a), ry * cos(a))
+            k.append(copysign(rx * ry / speed**3, sweep) if speed else float('inf'))
+            dists.append(abs(self.ellipse.arcLength(a) - self._startLength))
+        return PathPoints(ts, x, y, dx, dy, k, dists)
+
+    def ts_at_lengths(self, lengths):
+        direction = 1 if self.end >= self.start else -1
+        angles = self.ellipse.anglesAtArcLengths([self._startLength + direction * l for l in lengths])
+        sweep = self.end - self.start
+        return [min(max((a - self.start) / sweep, 0), 1) if sweep else 0 for a in angles]
+
+    def subdivide(self, part_length, start_offset=0):
+        nr_parts = int((self.length - start_offset) / part_length + 10E-10)
+        lengths = [start_offset + k * part_length for k in range(nr_parts + 1)]
+        points = _pathpoint_list(self.evaluate(self.ts_at_lengths(lengths)))
+        return(points, self.length - points[-1].c_dist)
+
+
+class CompositePath(object):
+    """Sequence of PathSegments (Line, BezierCurve, EllipticArc) parameterized by the distance along the whole path.
+
+    Keeps the cumulative length at the start of every segment, so a distance is located in
+    O(log n) and a whole outline can be subdivided in one pass, without carrying the leftover
+    length from one segment to the next by hand.
+    """
+
+    def __init__(self, segments=(), closed=False):
+        self.segments = []
+        self.offsets = [0]  # cumulative length at the start of each segment, and the total length
+        self.closed = closed
+        for segment in segments:
+            self.append(segment)
+
+    def append(self, segment):
+        self.segments.append(segment)
+        self.offsets.append(self.offsets[-1] + segment.length)
+
+    def __len__(self):
+        return len(self.segments)
+
+    def __iter__(self):
+        return iter(self.segments)
+
+    @property
+    def length(self):
+        return self.offsets[-1]
+
+    def segment_at_distance(self, distance):
+        """Index of the segment that contains the point at distance from the start."""
+        return min(max(bisect_right(self.offsets, distance) - 1, 0), len(self.segments) - 1)
+
+    def points_at_distances(self, distances):
+        """PathPoint for each distance from the start of the path; c_dist is measured along the whole path.
+
+        Each segment is evaluated once for all distances that fall on it.
+        """
+        distances = list(distances)
+        bySegment = {}
+        for i, d in enumerate(distances):
+            bySegment.setdefault(self.segment_at_distance(d), []).append(i)
+        points = [None] * len(distances)
+        for s, indices in bySegment.items():
+            segment, offset = self.segments[s], self.offsets[s]
+            pts = _pathpoint_list(segment.evaluate(segment.ts_at_lengths([distances[i] - offset for i in indices])))
+            for i, p in zip(indices, pts):
+                points[i] = p._replace(c_dist=p.c_dist + offset)
+        return points
+
+    def point_at_distance(self, distance):
+        return self.points_at_distances([distance])[0]
+
+    def subdivide(self, part_length, start_offset=0):
+        """Points every part_length along the whole path, starting at start_offset. Returns the points and the leftover length."""
+        nr_parts = int((self.length - start_offset) / part_length + 10E-10)
+        points = self.points_at_distances(start_offset + k * part_length for k in range(nr_parts + 1))
+        return(points, self.length - points[-1].c_dist)
+
+
+def _polygon_area(xs, ys):
+    """Signed area of the polygon, positive when its vertices run counterclockwise with the y-axis up."""
+    return sum(xs[k - 1] * ys[k] - xs[k] * ys[k - 1] for k in range(len(xs))) / 2
+
+def _segment_piece(segment, tolerance, distance):
+    """(xs, ys, nxs, nys): points on the segment and the unit normals to their left, or None for a point."""
+    if isinstance(segment, Line):
+        dx, dy = segment.end.x - segment.start.x, segment.end.y - segment.start.y
+        length = hypot(dx, dy)
+        if not length:
+            return None
+        return [segment.start.x, segment.end.x], [segment.start.y, segment.end.y], [-dy / length] * 2, [dx / length] * 2
+    # the offset curve is flat enough when the curve is flat enough at the (outer) offset radius
+    points = segment.subdivide_curvature(tolerance, thickness=-abs(distance))
+    xs = [p.coord.x for p in points]
+    ys = [p.coord.y for p in points]
+    nxs, nys = [], []
+    for k, p in enumerate(points):
+        tx, ty = p.tangent.x, p.tangent.y
+        if not (tx or ty):  # e.g. at a control point that coincides with an end point
+            a, b = max(k - 1, 0), min(k + 1, len(points) - 1)
+            tx, ty = xs[b] - xs[a], ys[b] - ys[a]
+        length = hypot(tx, ty)
+        if not length:
+            return None
+        nxs.append(-ty / length)
+        nys.append(tx / length)
+    return xs, ys, nxs, nys
+
+def _offset_join(xs, ys, vx, vy, n1x, n1y, n2x, n2y, d, join, miter_limit, tolerance):
+    """Append the join points around vertex (vx, vy) between offset normals n1 and n2."""
+    cross = n1x * n2y - n1y * n2x
+    dot = n1x * n2x + n1y * n2y
+    if d * cross >= 0:
+        return  # inner side (or straight on): the offset edges cross, the loop is removed later
+    if join == 'miter':
+        if dot > -1 and sqrt(2 / (1 + dot)) <= miter_limit:
+            xs.append(vx + d * (n1x + n2x) / (1 + dot))
+            ys.append(vy + d * (n1y + n2y) / (1 + dot))
+    elif join == 'round':
+        sweep = atan2(cross, dot)
+        step = 2 * acos(1 - tolerance / abs(d)) if tolerance < abs(d) else pi / 2
+        nr_steps = int(ceil(abs(sweep) / step))
+        start = atan2(n1y, n1x)
+        for k in range(1, nr_steps):
+            a = start + sweep * k / nr_steps
+            xs.append(vx + d * cos(a))
+            ys.append(vy + d * sin(a))
+    elif join != 'bevel':
+        raise ValueError("Unknown join: {0!r}".format(join))
+
+def _remove_loops(xs, ys, closed, junk):
+    """Remove the loops that junk(signed loop area) accepts from the polyline, where it crosses itself."""
+    while True:
+        keep = [k for k in range(len(xs)) if xs[k] != xs[k - 1] or ys[k] != ys[k - 1] or (k == 0 and not closed)]
+        xs, ys = [xs[k] for k in keep], [ys[k] for k in keep]
+        n = len(xs)
+        nr_edges = n if closed else n - 1
+        if nr_edges < 3:
+            return xs, ys
+        edges = [(Coordinate(xs[k], ys[k]), Coordinate(xs[(k + 1) % n], ys[(k + 1) % n])) for k in range(nr_edges)]
+        hits = [(i, j, pt) for i, j, pt in segment_intersections(edges) if j > i + 1 and not (closed and i == 0 and j == n - 1)]
+        hits.sort(key=lambda hit : (hit[0], -hit[1]))
+        total = _polygon_area(xs, ys) if closed else 0
+        new_xs, new_ys = [], []
+        done = 0        # the vertices before done have been copied or removed
+        retry = False   # a loop overlapped one that was removed, look again
+        for i, j, pt in hits:
+            if i < done:
+                retry = True
+                continue
+            loop_x, loop_y = [pt.x] + xs[i + 1:j + 1], [pt.y] + ys[i + 1:j + 1]
+            area = _polygon_area(loop_x, loop_y)
+            if closed and abs(total - area) < abs(area):
+                if junk(total - area):  # the smaller loop runs through the start of the outline
+                    new_xs, new_ys, done, retry = loop_x, loop_y, None, True
+                    break
+                continue
+            if junk(area):
+                new_xs.extend(xs[done:i + 1] + [pt.x])
+                new_ys.extend(ys[done:i + 1] + [pt.y])
+                done = j + 1
+        if done == 0:
+            return xs, ys
+        if done is not None:
+            new_xs.extend(xs[done:])
+            new_ys.extend(ys[done:])
+        # shortening edges to a crossing can't make new crossings, only skipped loops are left
+        xs, ys = new_xs, new_ys
+        if not retry:
+            return xs, ys
+
+def offset_path(path, distance, closed=None, join='miter', miter_limit=4, tolerance=0.01):
+    """CoordinateArray with the vertices of the path offset by distance, e.g. half the kerf of a laser.
+
+    path is a CompositePath, a list of PathSegments (Line, BezierCurve, EllipticArc), a single
+    segment or an Ellipse (around the origin). closed defaults to CompositePath.closed (always
+    True for an Ellipse). A closed outline grows for a positive distance and shrinks for a
+    negative one, whatever its direction; an open path is offset to the left (with the y-axis
+    up) for a positive distance. Curves are offset along their exact normals and flattened to
+    within tolerance. Corners get a join: 'miter' (falling back to a bevel beyond miter_limit
+    times the distance), 'round' or 'bevel'. The loops the offset edges make where they cross
+    are removed, with one bulk segment_intersections per pass.
+    """
+    if isinstance(path, Ellipse):
+        path, closed = [EllipticArc(Coordinate(0, 0), path.w / 2, path.h / 2, 0, 2 * pi)], True
+    elif isinstance(path, PathSegment):
+        path = [path]
+    if closed is None:
+        closed = getattr(path, 'closed', False)
+    pieces = [piece for piece in (_segment_piece(s, tolerance, distance) for s in path) if piece is not None]
+    if not pieces:
+        return CoordinateArray()
+    if closed:
+        area = _polygon_area([x for piece in pieces for x in piece[0]], [y for piece in pieces for y in piece[1]])
+        d = -distance if area > 0 else distance     # outward is to the right of a counterclockwise outline
+    else:
+        d = distance
+    xs, ys = [], []
+    for k, (pxs, pys, nxs, nys) in enumerate(pieces):
+        if k or closed:
+            previous = pieces[k - 1]
+            _offset_join(xs, ys, pxs[0], pys[0], previous[2][-1], previous[3][-1], nxs[0], nys[0], d, join, miter_limit, tolerance)
+        xs.extend([x + d * nx for x, nx in zip(pxs, nxs)])
+        ys.extend([y + d * ny for y, ny in zip(pys, nys)])
+    # loops at inner corners and cusps run against the offset side; when an outline grows all
+    # loops are junk, including the inverted ones where a narrow gap closes
+    growing = closed and distance > 0
+    junk = lambda area : growing or area * d <= 0
+    if closed:
+        # start halfway the longest edge, so the loop at a corner rarely runs through the start
+        k = max(range(len(xs)), key=lambda k : hypot(xs[k] - xs[k - 1], ys[k] - ys[k - 1]))
+        mid = ((xs[k - 1] + xs[k]) / 2, (ys[k - 1] + ys[k]) / 2)
+        xs, ys = [mid[0]] + xs[k:] + xs[:k], [mid[1]] + ys[k:] + ys[:k]
+    xs, ys = _remove_loops(xs, ys, closed, junk)
+    if closed and len(xs) > 3 and (xs[0], ys[0]) == mid:
+        if (xs[1] - xs[0]) * (ys[0] - ys[-1]) == (ys[1] - ys[0]) * (xs[0] - xs[-1]):
+            xs, ys = xs[1:], ys[1:]     # still halfway a straight edge
+    return CoordinateArray(xs, ys)
+
+
+def _outline_polygon(outline, tolerance):
+    """x and y values of the vertices of a polygon, CompositePath or Ellipse (flattened to within tolerance)."""
+    if isinstance(outline, Ellipse):
+        outline = [EllipticArc(Coordinate(0, 0), outline.w / 2, outline.h / 2, 0, 2 * pi)]
+    segments = outline.segments if isinstance(outline, CompositePath) else outline
+    if not len(segments) or not isinstance(segments[0], PathSegment):
+        return _coordinate_lists(outline)
+    xs, ys = [], []
+    for segment in segments:
+        if isinstance(segment, Line):
+            xs.append(segment.start.x)
+            ys.append(segment.start.y)
+        else:
+            points = segment.subdivide_curvature(tolerance)[:-1]
+            xs.extend(p.coord.x for p in points)
+            ys.extend(p.coord.y for p in points)
+    return xs, ys
+
+def hatch(outlines, spacing, angle=0, offset=0, alternate=False, tolerance=0.01):
+    """Hatch lines that fill the closed outlines, as (starts, ends) CoordinateArrays for draw_lines.
+
+    outlines is one outline or a list of them (holes are filled with the even-odd rule); an
+    outline is a polygon (CoordinateArray or sequence of Coordinates), a CompositePath (e.g.
+    from parse_path) or an Ellipse, with curves flattened to within tolerance. The lines are
+    spacing apart at angle (0 is along the x-axis) and at offset from the origin, so adjacent
+    fills line up. With alternate every other line runs backwards, for less travel.
+    All edges go into one table sorted by their lowest point, which a single sweep over the
+    scanlines activates and retires.
+    """
+    if isinstance(outlines, (CoordinateArray, CompositePath, Ellipse)) or (outlines and isinstance(outlines[0], (Coordinate, PathSegment))):
+        outlines = [outlines]
+    c, s = cos(angle), sin(angle)
+    edges = []  # (lowest y, highest y, x at lowest y, dx/dy) in the frame where the lines are horizontal
+    for outline in outlines:
+        xs, ys = _outline_polygon(outline, tolerance)
+        rx = [x * c + y * s for x, y in zip(xs, ys)]
+        ry = [y * c - x * s for x, y in zip(xs, ys)]
+        for k in range(len(rx)):
+            x1, y1, x2, y2 = rx[k - 1], ry[k - 1], rx[k], ry[k]
+            if y1 == y2:
+                continue
+            if y1 > y2:
+                x1, y1, x2, y2 = x2, y2, x1, y1
+            edges.append((y1, y2, x1, (x2 - x1) / (y2 - y1)))
+    starts, ends = CoordinateArray(), CoordinateArray()
+    if not edges:
+        return starts, ends
+    edges.sort()
+    top = max(e[1] for e in edges)
+    first = int(ceil((edges[0][0] - offset) / spacing))
+    active, next_edge = [], 0
+    for row in range(first, int(ceil((top - offset) / spacing))):
+        y = offset + row * spacing
+        while next_edge < len(edges) and edges[next_edge][0] <= y:
+            active.append(edges[next_edge])
+            next_edge += 1
+        active = [e for e in active if e[1] > y]    # edges are half open, so a vertex is crossed once
+        crossings = sorted(x0 + (y - y0) * slope for y0, y1, x0, slope in active)
+        for k in range(0, len(crossings) - 1, 2):
+            a, b = crossings[k], crossings[k + 1]
+            if a == b:
+                continue
+            if alternate and row % 2:
+                a, b = b, a
+            starts.append(Coordinate(a * c - y * s, a * s + y * c))
+            ends.append(Coordinate(b * c - y * s, b * s + y * c))
+    return starts, ends
+
+
+_PATH_COMMAND = re.compile(r'[\s,]*([MmZzLlHhVvCcSsQqTtAa])')
+_PATH_NUMBER = re.compile(r'[\s,]*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)')
+_PATH_FLAG = re.compile(r'[\s,]*([01])')
+
+def iter_path_commands(d):
+    """Yield (command, absolute operands) for every command in the path data d, in a single pass.
+
+    Commands are returned as upper case letters with their operands converted to absolute
+    coordinates; implicitly repeated commands are returned one by one (coordinates after a
+    move are line segments). Arc flags may be written without separators.
+    """
+    pos, end = 0, len(d.rstrip())
+    cx = cy = sx = sy = 0.0
+    command = None
+    while pos < end:
+        m = _PATH_COMMAND.match(d, pos)
+        if m:
+            command = m.group(1)
+            pos = m.end()
+        elif command is None or command in 'Zz':
+            raise ValueError("Invalid path data at position {0}: {1!r}".format(pos, d[pos:pos + 20]))
+        upper = command.upper()
+        if upper == 'Z':
+            cx, cy = sx, sy
+            yield 'Z', []
+            continue
+        kinds = _PATH_OPERANDS[command.lower()]
+        values = []
+        for i, kind in enumerate(kinds):
+            m = (_PATH_FLAG if command in 'Aa' and i in (3, 4) else _PATH_NUMBER).match(d, pos)
+            if not m:
+                raise ValueError("Invalid path data at position {0}: {1!r}".format(pos, d[pos:pos + 20]))
+            pos = m.end()
+            value = float(m.group(1))
+            if command != upper:
+                value += cx if kind == 'x' else cy if kind == 'y' else 0
+            values.append(value)
+        if upper == 'H':
+            cx = values[0]
+        elif upper == 'V':
+            cy = values[0]
+        else:
+            cx, cy = values[-2], values[-1]
+        if upper == 'M':
+            sx, sy = cx, cy
+            command = 'L' if command == 'M' else 'l'
+        yield upper, values
+
+def _svg_arc_segment(start, rx, ry, rotation, large_arc, sweep, end):
+    """EllipticArc for an SVG arc command (center parameterization, SVG spec F.6.5), or a Line if a radius is zero."""
+    rx, ry = abs(rx), abs(ry)
+    if rx == 0 or ry == 0:
+        return Line(start, end)
+    phi = radians(rotation)
+    cp, sp = cos(phi), sin(phi)
+    hx, hy = (start.x - end.x) / 2, (start.y - end.y) / 2
+    x1, y1 = cp * hx + sp * hy, -sp * hx + cp * hy
+    scale = (x1 / rx) ** 2 + (y1 / ry) ** 2
+    if scale > 1:   # radii too small to reach the end point
+        rx, ry = rx * sqrt(scale), ry * sqrt(scale)
+    num = rx**2 * ry**2 - rx**2 * y1**2 - ry**2 * x1**2
+    factor = sqrt(max(num, 0) / (rx**2 * y1**2 + ry**2 * x1**2))
+    if large_arc == sweep:
+        factor = -factor
+    cx1, cy1 = factor * rx * y1 / ry, -factor * ry * x1 / rx
+    center = Coordinate(cp * cx1 - sp * cy1 + (start.x + end.x) / 2, sp * cx1 + cp * cy1 + (start.y + end.y) / 2)
+    theta = atan2((y1 - cy1) / ry, (x1 - cx1) / rx)
+    delta = atan2((-y1 - cy1) / ry, (-x1 - cx1) / rx) - theta
+    if sweep and delta < 0:
+        delta += 2 * pi
+    elif not sweep and delta > 0:
+        delta -= 2 * pi
+    return EllipticArc(center, rx, ry, theta, theta + delta, phi)
+
+def parse_path(d):
+    """Parse SVG path data into a list of CompositePaths, one per subpath.
+
+    Lines (including H and V) become Line, curves (including the smooth S and T forms)
+    BezierCurve and arcs EllipticArc segments. A closed subpath ends with a line back to its
+    start point if it isn't there already, and has its closed attribute set.
+    """
+    subpaths = []
+    current = None
+    cur = start = Coordinate(0, 0)
+    control, prev = None, None
+    for command, v in iter_path_commands(d):
+        if command == 'M':
+            cur = start = Coordinate(v[0], v[1])
+            current = None
+        else:
+            if current is None:
+                current = CompositePath()
+                subpaths.append(current)
+            if command == 'Z':
+                if cur != start:
+                    current.append(Line(cur, start))
+                current.closed = True
+                current = None
+                cur = start
+            else:
+                if command in 'LHV':
+                    end = Coordinate(v[0], cur.y) if command == 'H' else Coordinate(cur.x, v[0]) if command == 'V' else Coordinate(v[0], v[1])
+                    segment = Line(cur, end)
+                elif command in 'CS':
+                    c1 = Coordinate(v[0], v[1]) if command == 'C' else (cur * 2 - control if prev in 'CS' else cur)
+                    control, end = Coordinate(v[-4], v[-3]), Coordinate(v[-2], v[-1])
+                    segment = BezierCurve([cur, c1, control, end])
+                elif command in 'QT':
+                    control = Coordinate(v[0], v[1]) if command == 'Q' else (cur * 2 - control if prev in 'QT' else cur)
+                    end = Coordinate(v[-2], v[-1])
+                    segment = BezierCurve([cur, control, end])
+                else:
+                    end = Coordinate(v[5], v[6])
+                    segment = None if end == cur else _svg_arc_segment(cur, v[0], v[1], v[2], v[3], v[4], end)
+                if segment is not None:
+                    current.append(segment)
+                cur = end
+        prev = command
+    return subpaths
+
+def parse_path_points(d):
+    """The end points of all commands in the path data d as one CoordinateArray per subpath, without building segments."""
+    subpaths = []
+    points = None
+    x = y = sx = sy = 0.0
+    for command, v in iter_path_commands(d):
+        if command == 'M':
+            points = CoordinateArray()
+            subpaths.append(points)
+            sx, sy = v[0], v[1]
+        elif points is None:    # drawing continues after a close without a move
+            points = CoordinateArray([x], [y])
+            subpaths.append(points)
+        if command == 'Z':
+            points = None
+            x, y = sx, sy
+            continue
+        if command == 'H':
+            x = v[0]
+        elif command == 'V':
+            y = v[0]
+        else:
+            x, y = v[-2], v[-1]
+        points.append(Coordinate(x, y))
+    return subpaths
@@ -1,11 +1,17 @@
 #!/usr/bin/env python
 from __future__ import division
 import inkex
-import simplestyle
-
 
 from math import *
-from collections import namedtuple
+from array import array
+from contextlib import contextmanager
+import os
+import sys
+
+# The geometry lives in its own module so it can be imported without inkex
+import inkscape_geometry
+from inkscape_geometry import *
+from inkscape_geometry import _coordinate_lists, _polyline_keep, _PATH_OPERANDS
 
 
 #Note: keep in mind that SVG coordinates start in the top-left corner i.e. with an inverted y-axis
@@ -13,25 +19,20 @@ from collections import namedtuple
 errormsg = inkex.errormsg
 debug = inkex.debug
 
-default_style = simplestyle.formatStyle(
-    {'stroke': '#000000',
-    'stroke-width': '1',
-    'fill': 'none'
-    })
+# formatted like simplestyle.formatStyle would, without importing it at startup
+default_style = 'stroke:#000000;stroke-width:1;fill:none'
+
+groove_style = 'stroke:#0000FF;stroke-width:1;fill:none'
 
-groove_style = simplestyle.formatStyle(
-    {'stroke': '#0000FF',
-    'stroke-width': '1',
-    'fill': 'none'
-    })
+mark_style = 'stroke:#00FF00;stroke-width:1;fill:none'
 
-mark_style = simplestyle.formatStyle(
-    {'stroke': '#00FF00',
-    'stroke-width': '1',
-    'fill': 'none'
-    })
+_text_style = 'text-align:center;text-anchor:middle'
+
+_instrumentation = None   # the active Instrumentation, if any (mirrors inkscape_geometry._instrumentation)
 
 def draw_rectangle(parent, w, h, x, y, rx=0, ry=0, style=default_style):
+    if _instrumentation is not None:
+        _instrumentation.count('draw_rectangle')
     attribs = {
         'style': style,
         'height': str(h),
@@ -45,6 +46,8 @@ def draw_rectangle(parent, w, h, x, y, rx=0, ry=0, style=default_style):
     inkex.etree.SubElement(parent, inkex.addNS('rect', 'svg'), attribs)
 
 def draw_ellipse(parent, rx, ry, center, start_end=(0, 2*pi), style=default_style, transform=''):
+    if _instrumentation is not None:
+        _instrumentation.count('draw_ellipse')
     ell_attribs = {'style': style,
         inkex.addNS('cx', 'sodipodi'): str(center.x),
         inkex.addNS('cy', 'sodipodi'): str(center.y),
@@ -70,27 +73,98 @@ def draw_arc(parent, rx, ry, x_axis_rot, style=default_style):
         'y': ''
         }
         #name='part'
+    import simplestyle
     style = {'stroke': '#000000', 'fill': 'none'}
     drw = {'style':simplestyle.formatStyle(style),inkex.addNS('label','inkscape'):name,'d':XYstring}
     inkex.etree.SubElement(parent, inkex.addNS('path', 'svg'), drw)
     inkex.addNS('', 'svg')
 
 def draw_text(parent, coordinate, txt, style=default_style):
+    if _instrumentation is not None:
+        _instrumentation.count('draw_text')
     text = inkex.etree.Element(inkex.addNS('text', 'svg'))
     text.text = txt
     text.set('x', str(coordinate.x))
     text.set('y', str(coordinate.y))
-    style = {'text-align': 'center', 'text-anchor': 'middle'}
-    text.set('style', simplestyle.formatStyle(style))
+    text.set('style', _text_style)
     parent.append(text)
 
 #draw an SVG line segment between the given (raw) points
-def draw_line(parent, start, end, style = default_style):
+def draw_line(parent, start, end, style = default_style, precision=None):
+    if _instrumentation is not None:
+        _instrumentation.count('draw_line')
+    sx, sy, ex, ey = [_format_number(v, precision) for v in (start.x, start.y, end.x, end.y)]
     line_attribs = {'style': style,
-                    'd': 'M '+str(start.x)+','+str(start.y)+' L '+str(end.x)+','+str(end.y)}
+                    'd': 'M '+sx+','+sy+' L '+ex+','+ey}
 
     inkex.etree.SubElement(parent, inkex.addNS('path', 'svg'), line_attribs)
 
+# Batch versions of the draw_* functions: they take sequences (or CoordinateArrays) of
+# points and emit all elements in one go, sharing the attribute values that don't change
+
+def draw_lines(parent, starts, ends, style=default_style, merge=False):
+    """Draw a line from each start to the corresponding end.
+
+    With merge all lines become subpaths of a single path element, which keeps the document
+    small and renders faster. Returns the list of created elements.
+    """
+    start_xs, start_ys = _coordinate_lists(starts)
+    end_xs, end_ys = _coordinate_lists(ends)
+    tag = inkex.addNS('path', 'svg')
+    ds = ['M '+str(sx)+','+str(sy)+' L '+str(ex)+','+str(ey) for sx, sy, ex, ey in zip(start_xs, start_ys, end_xs, end_ys)]
+    if _instrumentation is not None:
+        _instrumentation.count('draw_lines', len(ds))
+    if merge:
+        return [inkex.etree.SubElement(parent, tag, {'style': style, 'd': ' '.join(ds)})] if ds else []
+    return [inkex.etree.SubElement(parent, tag, {'style': style, 'd': d}) for d in ds]
+
+def draw_rectangles(parent, rectangles, rx=0, ry=0, style=default_style):
+    """Draw a rectangle for each (w, h, x, y) in rectangles. Returns the list of created elements."""
+    tag = inkex.addNS('rect', 'svg')
+    rounded = {'rx': str(rx), 'ry': str(ry)} if rx != 0 and ry != 0 else {}
+    elements = []
+    for w, h, x, y in rectangles:
+        attribs = {'style': style, 'height': str(h), 'width': str(w), 'x': str(x), 'y': str(y)}
+        attribs.update(rounded)
+        elements.append(inkex.etree.SubElement(parent, tag, attribs))
+    if _instrumentation is not None:
+        _instrumentation.count('draw_rectangles', len(elements))
+    return elements
+
+def draw_ellipses(parent, radii, centers, start_end=(0, 2*pi), style=default_style, transform=''):
+    """Draw an (open) ellipse for each (rx, ry) in radii around the corresponding center. Returns the list of created elements."""
+    tag = inkex.addNS('path', 'svg')
+    names = [inkex.addNS(name, 'sodipodi') for name in ('cx', 'cy', 'rx', 'ry')]
+    shared = {'style': style,
+        inkex.addNS('start', 'sodipodi'): str(start_end[0]),
+        inkex.addNS('end', 'sodipodi'): str(start_end[1]),
+        inkex.addNS('open', 'sodipodi'): 'true',
+        inkex.addNS('type', 'sodipodi'): 'arc',
+        'transform': transform
+    }
+    cxs, cys = _coordinate_lists(centers)
+    elements = []
+    for (rx, ry), cx, cy in zip(radii, cxs, cys):
+        attribs = dict(zip(names, (str(cx), str(cy), str(rx), str(ry))))
+        attribs.update(shared)
+        elements.append(inkex.etree.SubElement(parent, tag, attribs))
+    if _instrumentation is not None:
+        _instrumentation.count('draw_ellipses', len(elements))
+    return elements
+
+def draw_texts(parent, coordinates, texts, style=default_style):
+    """Draw each text centered on the corresponding coordinate. Returns the list of created elements."""
+    tag = inkex.addNS('text', 'svg')
+    xs, ys = _coordinate_lists(coordinates)
+    elements = []
+    for x, y, txt in zip(xs, ys, texts):
+        text = inkex.etree.SubElement(parent, tag, {'x': str(x), 'y': str(y), 'style': _text_style})
+        text.text = txt
+        elements.append(text)
+    if _instrumentation is not None:
+        _instrumentation.count('draw_texts', len(elements))
+    return elements
+
 def layer(parent, layer_name):
     layer = inkex.etree.SubElement(parent, 'g')
     layer.set(inkex.addNS('label', 'inkscape'), layer_name)
@@ -101,81 +175,82 @@ def group(parent):
     return inkex.etree.SubElement(parent, 'g')
 
 
-class IntersectionError(ValueError):
-        """Raised when two lines do not intersect."""
-
-def on_segment(pt, start, end):
-    """Check if pt is between start and end. The three points are presumed to be collinear."""
-    pt -= start
-    end -= start
-    ex, ey = end.x, end.y
-    px, py = pt.x, pt.y
-    px *= cmp(ex, 0)
-    py *= cmp(ey, 0)
-    return px >= 0 and px <= abs(ex) and py >= 0 and py <= abs(ey)
-
-def intersection (s1, e1, s2, e2, on_segments = True):
-    D = (s1.x - e1.x) * (s2.y - e2.y) - (s1.y - e1.y) * (s2.x - e2.x)
-    if D == 0:
-        raise IntersectionError("Lines from {s1} to {e1} and {s2} to {e2} are parallel")
-    N1 = s1.x * e1.y - s1.y * e1.x
-    N2 = s2.x * e2.y - s2.y * e2.x
-    I = ((s2 - e2) * N1 - (s1 - e1) * N2) / D
-
-    if on_segments and not (on_segment(I, s1, e1) and on_segment(I, s2, e2)):
-        raise IntersectionError("Intersection {0} is not on line segments [{1} -> {2}] [{3} -> {4}]".format(I, s1, e1, s2, e2))
-    return I
-
-
-def inner_product(a, b):
-    return a.x * b.x + a.y * b.y
-
-class Coordinate:
-    def __init__(self, x, y):
-        self.x = float(x)
-        self.y = float(y)
-
-    @property
-    def t(self):
-        return atan2(self.y, self.x)
-
-    #@t.setter
-    #def t(self, value):
+class StreamingWriter(object):
+    """Writes a document to a (binary) stream while its layers are generated, so memory stays flat.
 
-    @property
-    def r(self):
-        return hypot(self.x, self.y)
-
-    #@r.setter
-    #def r(self, value):
-
-    def __repr__(self):
-        return self.__str__()
-
-    def __str__(self):
-        return "(%f, %f)" % (self.x, self.y)
-
-    def __eq__(self, other):
-        return self.x == other.x and self.y == other.y
-
-    def __add__(self, other):
-        return Coordinate(self.x + other.x, self.y + other.y)
-
-    def __sub__(self, other):
-        return Coordinate(self.x - other.x, self.y - other.y)
-
-    def __mul__(self, factor):
-        return Coordinate(self.x * factor, self.y * factor)
+    Layers and groups are created in an empty copy of the root element and are serialized and
+    dropped when their with block ends; everything that is already in the document is written
+    before the first of them, so it must be complete by then. The output is byte for byte what
+    document.write(stream) would write with the layers appended to the root.
+    """
+    def __init__(self, document, stream):
+        self.document = document
+        self.stream = stream
+        root = document.getroot()
+        self._shell = inkex.etree.Element(root.tag, nsmap=root.nsmap)  # same namespaces in scope as in the document
+        self._shell_start, self._shell_end = self._split(self._shell, self._shell)
+        self._tail = None   # what follows the streamed elements, once the start has been written
+
+    @staticmethod
+    def _split(node, parent):
+        """Serialization of node around the (future) end of parent's children."""
+        marker = inkex.etree.Comment(' inkscape_helper streaming marker ')
+        parent.append(marker)
+        try:
+            data = inkex.etree.tostring(node)
+        finally:
+            parent.remove(marker)
+        i = data.rindex(inkex.etree.tostring(marker))
+        return data[:i], data[i + len(inkex.etree.tostring(marker)):]
+
+    def _start(self):
+        if self._tail is None:
+            start, self._tail = self._split(self.document, self.document.getroot())
+            self.stream.write(start)
+
+    def write(self, element):
+        """Write element (and its tail) as the next child of the root. The element is moved out of its parent."""
+        self._start()
+        self._shell.append(element)
+        try:
+            data = inkex.etree.tostring(self._shell)
+        finally:
+            self._shell.remove(element)
+        self.stream.write(data[len(self._shell_start):len(data) - len(self._shell_end)])
+        if _instrumentation is not None:
+            _instrumentation.count('StreamingWriter.write')
+
+    @contextmanager
+    def layer(self, layer_name):
+        """with writer.layer(name) as l: draws into a new layer, which is written when the block ends."""
+        element = layer(self._shell, layer_name)
+        yield element
+        self.write(element)
+
+    @contextmanager
+    def group(self):
+        element = group(self._shell)
+        yield element
+        self.write(element)
 
-    def __rmul__(self, other):
-        return self * other
+    def close(self):
+        """Write the end of the document."""
+        self._start()
+        self.stream.write(self._tail)
+        self._tail = b''
 
-    def __div__(self, quotient):
-        return Coordinate(self.x / quotient, self.y / quotient)
 
-    def __truediv__(self, quotient):
-        return self.__div__(quotient)
+INSTRUMENT_ENV = 'INKSCAPE_HELPER_INSTRUMENT'
+PROFILE_ENV = 'INKSCAPE_HELPER_PROFILE'
+CACHE_ENV = 'INKSCAPE_HELPER_CACHE'
 
+def _option_value(args, name):
+    """Value of --name=value in args, without running the option parser."""
+    prefix = '--' + name + '='
+    for arg in args:
+        if arg.startswith(prefix):
+            return arg[len(prefix):]
+    return None
 
 
 class Effect(inkex.Effect):
@@ -185,6 +260,14 @@ class Effect(inkex.Effect):
     def __init__(self, options=None):
         inkex.Effect.__init__(self)
         self.knownUnits = ['in', 'pt', 'px', 'mm', 'cm', 'm', 'km', 'pc', 'yd', 'ft']
+        self.stream_file = None     # binary stream for stream_layer, stdout when None
+        self._writer = None
+        self.OptionParser.add_option('--instrument', type = 'string', dest = 'instrument', default = '',
+            help = 'write timings and call counts of this run to the given file')
+        self.OptionParser.add_option('--instrument_profile', type = 'inkbool', dest = 'instrument_profile', default = False,
+            help = 'also write cProfile statistics next to the instrumentation report')
+        self.OptionParser.add_option('--cache_dir', type = 'string', dest = 'cache_dir', default = '',
+            help = 'keep computed geometry in this directory, to speed up reruns with similar parameters')
 
         if options != None:
             for opt in options:
@@ -202,6 +285,58 @@ class Effect(inkex.Effect):
         except AttributeError:
             pass
 
+    def affect(self, args=sys.argv[1:], output=True):
+        """Run the effect, instrumented when requested through INKSCAPE_HELPER_INSTRUMENT or --instrument.
+
+        Computed geometry is cached on disk when requested through INKSCAPE_HELPER_CACHE or --cache_dir.
+        """
+        return self._run_with_options(args, lambda : inkex.Effect.affect(self, args, output))
+
+    def _run_with_options(self, args, run):
+        """Call run() with the geometry cache and the instrumentation that args or the environment ask for."""
+        global _instrumentation
+        cache_dir = _option_value(args, 'cache_dir') or os.environ.get(CACHE_ENV)
+        if cache_dir:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            GeometryCache.directory = cache_dir
+        report_file = _option_value(args, 'instrument') or os.environ.get(INSTRUMENT_ENV)
+        if not report_file:
+            return run()
+        profile = _option_value(args, 'instrument_profile') in ('true', 'True', '1') or bool(os.environ.get(PROFILE_ENV))
+        _instrumentation = inkscape_geometry._instrumentation = Instrumentation(report_file, profile)
+        for name in ('getoptions', 'parse', 'effect', 'output'):
+            setattr(self, name, _instrumentation.timed(name, getattr(self, name)))
+        try:
+            if _instrumentation.profiler is not None:
+                _instrumentation.profiler.enable()
+            with phase('total'):
+                return run()
+        finally:
+            if _instrumentation.profiler is not None:
+                _instrumentation.profiler.disable()
+            _instrumentation.write()
+            _instrumentation = inkscape_geometry._instrumentation = None
+            for name in ('getoptions', 'parse', 'effect', 'output'):
+                delattr(self, name)
+
+    def stream_layer(self, layer_name):
+        """Context manager for a layer that is written to the output as soon as it is complete.
+
+        Use it instead of layer(self.document.getroot(), layer_name) for very large outputs, after
+        everything else in the document is done (see StreamingWriter).
+        """
+        if self._writer is None:
+            stream = self.stream_file or getattr(sys.stdout, 'buffer', sys.stdout)
+            self._writer = StreamingWriter(self.document, stream)
+        return self._writer.layer(layer_name)
+
+    def output(self):
+        if self._writer is None:
+            return inkex.Effect.output(self)
+        self._writer.close()
+        self._writer = None
+
     def effect(self):
         """
 
@@ -209,11 +344,100 @@ class Effect(inkex.Effect):
         pass
 
 
+def _option_args(options):
+    """Command line arguments for a dict of option values, as Inkscape would pass them."""
+    args = []
+    for name, value in sorted(options.items()):
+        if isinstance(value, bool):
+            value = 'true' if value else 'false'
+        args.append('--{0}={1}'.format(name, value))
+    return args
+
+def read_option_sets(filename):
+    """List of option dicts from a JSON file (a list of objects) or a CSV file (one set per row)."""
+    if filename.lower().endswith('.csv'):
+        import csv
+        with open(filename) as f:
+            return list(csv.DictReader(f))
+    import json
+    with open(filename) as f:
+        return json.load(f)
+
+class BatchRunner(object):
+    """Runs an Effect for many option sets on a template document that is parsed only once."""
+
+    def __init__(self, effect_class, template):
+        self.effect_class = effect_class
+        self.template = template
+        effect = effect_class()
+        effect.getoptions([template])
+        effect.parse(template)
+        self.document = effect.document
+
+    def run(self, options, output_file):
+        """Run the effect with options on a copy of the template and write the result to output_file.
+
+        Like Effect.affect, cache_dir and instrument options (or their environment variables)
+        enable the geometry cache and the instrumentation for the run.
+        """
+        import copy
+        effect = self.effect_class()
+        args = _option_args(options) + [self.template]
+        def run():
+            effect.getoptions(args)
+            effect.document = copy.deepcopy(self.document)
+            effect.getposinlayer()
+            effect.getselected()
+            effect.getdocids()
+            effect.effect()
+            effect.document.write(output_file)
+        directory = GeometryCache.directory
+        try:
+            effect._run_with_options(args, run)
+        finally:
+            GeometryCache.directory = directory    # a cache_dir applies to its own option set only
+        return output_file
+
+_batch_runner = None    # BatchRunner of a worker process
+
+def _init_batch_worker(effect_class, template):
+    global _batch_runner
+    _batch_runner = BatchRunner(effect_class, template)
+
+def _run_batch_job(job):
+    return _batch_runner.run(*job)
+
+def run_batch(effect_class, option_sets, template, output_dir, processes=None, name_field=None):
+    """Run effect_class once for every option set and write one SVG per set to output_dir.
+
+    The template is parsed once per process and the sets are spread over a pool of processes
+    (processes=None uses all cores, 1 runs everything in this process). Output files are named
+    after the name_field option of each set, or numbered. Returns the list of written files.
+    """
+    jobs = []
+    for i, options in enumerate(option_sets):
+        options = dict(options)
+        name = options.pop(name_field) if name_field else '{0:04d}'.format(i)
+        jobs.append((options, os.path.join(output_dir, name + '.svg')))
+    if processes == 1:
+        runner = BatchRunner(effect_class, template)
+        return [runner.run(*job) for job in jobs]
+    import multiprocessing
+    pool = multiprocessing.Pool(processes, _init_batch_worker, (effect_class, template))
+    try:
+        return pool.map(_run_batch_job, jobs)
+    finally:
+        pool.close()
+        pool.join()
+
+
 def _format_1st(command, is_absolute):
     return command.upper() if is_absolute else command.lower()
 
 class Path:
     def __init__(self):
+        if _instrumentation is not None:
+            _instrumentation.count('Path')
         self.nodes = []
 
     def move_to(self, coord, absolute=False):
@@ -234,9 +458,15 @@ class Path:
     def close(self):
         self.nodes.append('z')
 
-    def path(self, parent, style):
+    def path(self, parent, style, precision=None, tolerance=None):
+        """Add the path to parent, optimized with simplify_d when a precision or tolerance is given."""
+        if _instrumentation is not None:
+            _instrumentation.count('Path.path')
+        d = ' '.join(self.nodes)
+        if precision is not None or tolerance is not None:
+            d = simplify_d(d, tolerance or 0, precision)
         attribs = {'style': style,
-                    'd': ' '.join(self.nodes)}
+                    'd': d}
         inkex.etree.SubElement(parent, inkex.addNS('path', 'svg'), attribs)
 
     def curve(parent, segments, style, closed=True):
@@ -253,227 +483,372 @@ class Path:
         self.nodes.pop()
 
 
-PathPoint = namedtuple('PathPoint', 't coord tangent curvature c_dist')
-
-class PathSegment():
-
-    def __init__(self):
-        raise NotImplementedError
-
-    @property
-    def lenth(self):
-        raise NotImplementedError
+_array_bytes = array.tobytes if hasattr(array, 'tobytes') else array.tostring
 
-    def subdivide(self, part_length):
-        raise NotImplementedError
-    # also need:
+def _format_number(value, precision=None):
+    if precision is None:
+        return str(value)
+    s = '%.*f' % (precision, value)
+    if '.' in s:
+        s = s.rstrip('0').rstrip('.')
+    return '0' if s == '-0' else s
 
-    #   find a way do do curvature dependent spacing
-    #       - based on deviation from a standard radius?
-    #       - or ratio between thickness and curvature?
-    #def point_at_distance(d):
-    #    pass
+class PathBuffer(object):
+    """Path builder that stores commands and their operands as numbers instead of formatted strings.
 
+    Offers the same drawing methods as Path. The d attribute is only formatted when the path
+    is written out, in a single pass, with an optional number of decimals and a choice of
+    absolute, relative or the shortest of both for every command.
+    Formatted d attributes are kept in a GeometryCache.
+    """
+    dCache = GeometryCache('PathBuffer', 256)  # shared by all instances
 
-class Line(PathSegment):
-
-    def __init__(self, start, end):
-        self.start = start
-        self.end = end
-
-    @property
-    def length(self):
-        return (self.end - self.start).r
-
-    def subdivide(self, part_length, start_offset=0): # note: start_offset should be smaller than part_length
-        nr_parts = int((self.length - start_offset) // part_length)
-        k_o = start_offset / self.length
-        k2t = lambda k : k_o + k * part_length / self.length
-        pp = lambda t : PathPoint(t, self.start + t * (self.end - self.start), self.end - self.start, 0, t * self.length)
-        points = [pp(k2t(k)) for k in range(nr_parts + 1)]
-        return(points, self.length - points[-1].c_dist)
-
-
-
-class BezierCurve(PathSegment):
-    nr_points = 10
-    def __init__(self, P): # number of points is limited to 3 or 4
-
-        if len(P) == 3: # quadratic
-            self.B = lambda t : (1 - t)**2 * P[0] + 2 * (1 - t) * t * P[1] + t**2 * P[2]
-            Bd = lambda t : 2 * (1 - t) * (P[1] - P[0]) + 2 * t * (P[2] - P[1])
-            Bdd = lambda t : 2 * (P[2] - 2 * P[1] + P[0])
-        elif len(P) == 4: #cubic
-            self.B = lambda t : (1 - t)**3 * P[0] + 3 * (1 - t)**2 * t * P[1] + 3 * (1 - t) * t**2 * P[2] + t**3 * P[3]
-            Bd = lambda t : 3 * (1 - t)**2 * (P[1] - P[0]) + 6 * (1 - t) * t * (P[2] - P[1]) + 3 * t**2 * (P[3] - P[2])
-            Bdd = lambda t : 6 * (1 - t) * (P[2] - 2 * P[1] + P[0]) + 6 * t * (P[3] - 2 * P[2] + P[1])
-
-        self.tangent = lambda t : Bd(t)
-        self.curvature = lambda t : (Bd(t).x * Bdd(t).y - Bd(t).y * Bdd(t).x) / hypot(Bd(t).x, Bd(t).y)**3
+    def __init__(self):
+        if _instrumentation is not None:
+            _instrumentation.count('PathBuffer')
+        self.commands = []
+        self.operands = array('d')
 
-        self.distances = [0]    # cumulative distances for each 't'
-        prev_pt = self.B(0)
-        for i in range(self.nr_points):
-            t = (i + 1) / self.nr_points
-            pt = self.B(t)
-            self.distances.append(self.distances[-1] + hypot(prev_pt.x - pt.x, prev_pt.y - pt.y))
-            prev_pt = pt
-        self.length = self.distances[-1]
+    def __len__(self):
+        return len(self.commands)
 
     @classmethod
-    def quadratic(cls, start, c, end):
-        bezier = cls()
+    def from_d(cls, d):
+        """PathBuffer with the (absolute) commands of the path data d."""
+        buffer = cls()
+        for command, values in iter_path_commands(d):
+            buffer._add(command, True, *values)
+        return buffer
 
-    @classmethod
-    def cubic(cls, start, c1, c2, end):
-        bezier = cls()
+    def _add(self, command, absolute, *operands):
+        self.commands.append(_format_1st(command, absolute))
+        self.operands.extend(operands)
 
-    def __make_eq__(self):
-        pass
+    def move_to(self, coord, absolute=False):
+        self._add('m', absolute, coord.x, coord.y)
 
-    @property
-    def length(self):
-        return self.length
+    def line_to(self, coord, absolute=False):
+        self._add('l', absolute, coord.x, coord.y)
 
-    def subdivide(self, part_length, start_offset=0):
-        nr_parts = int((self.length - start_offset) / part_length + 10E-10)
-        print "NR PARTS:", nr_parts, self.length, start_offset, part_length, int(self.length / part_length), self.length - 2 * part_length
-        k_o = start_offset / self.length
-        k2t = lambda k : k_o + k * part_length / self.length
-        points = [self.pathpoint_at_t(k2t(k)) for k in range(nr_parts + 1)]
-        return(points, self.length - points[-1].c_dist)
+    def lines_to(self, coords, absolute=False):
+        """Append a line to each of the coordinates (a CoordinateArray or a sequence of Coordinates)."""
+        xs, ys = _coordinate_lists(coords)
+        self.commands.extend(_format_1st('l', absolute) * len(xs))
+        for x, y in zip(xs, ys):
+            self.operands.append(x)
+            self.operands.append(y)
 
+    def h_line_to(self, dist, absolute=False):
+        self._add('h', absolute, dist)
 
-    def pathpoint_at_t(self, t):
-        """pathpoint on the curve from t=0 to point at t."""
-        step = 1 / self.nr_points
-        pt_idx = int(t / step)
-        #print "index", pt_idx, self.distances[pt_idx]
-        length = self.distances[pt_idx]
-        ip_fact = (t - pt_idx * step) / step
+    def v_line_to(self, dist, absolute=False):
+        self._add('v', absolute, dist)
 
-        if ip_fact > 0 and t < 1: # not a perfect match, need to interpolate
-            length += ip_fact * (self.distances[pt_idx + 1] - self.distances[pt_idx])
+    def curve_to(self, c1, c2, end, absolute=False):
+        self._add('c', absolute, c1.x, c1.y, c2.x, c2.y, end.x, end.y)
 
-        return PathPoint(t, self.B(t), self.tangent(t), self.curvature(t), length)
+    def quadratic_to(self, c, end, absolute=False):
+        self._add('q', absolute, c.x, c.y, end.x, end.y)
 
+    def arc_to(self, rx, ry, x, y, rotation=0, pos_sweep=True, large_arc=False, absolute=False):
+        self._add('a', absolute, rx, ry, rotation, 1 if large_arc else 0, 1 if pos_sweep else 0, x, y)
 
-    def t_at_length(self, length):
-        """interpolated t where the curve is at the given length"""
-        if length == self.length:
-            return 1
-        i_small = 0
-        i_big = self.nr_points + 1
+    def close(self):
+        self._add('z', False)
 
-        while i_big - i_small > 1:  # binary search
-            i_half = i_small + (i_big - i_small) // 2
-            if self.distances[i_half] <= length:
-                i_small = i_half
+    def remove_last(self):
+        command = self.commands.pop()
+        del self.operands[len(self.operands) - len(_PATH_OPERANDS[command.lower()]):]
+
+    def iter_absolute(self):
+        """Yield (upper case command, absolute operands) for every command."""
+        cx = cy = sx = sy = 0.0
+        i = 0
+        for command in self.commands:
+            upper = command.upper()
+            kinds = _PATH_OPERANDS[command.lower()]
+            values = list(self.operands[i:i + len(kinds)])
+            i += len(kinds)
+            if upper == 'Z':
+                cx, cy = sx, sy
             else:
-                i_big = i_half
-
-        small_dist = self.distances[i_small]
-        return  i_small / self.nr_points + (length - small_dist) * (self.distances[i_big] - small_dist) # interpolated length
-
-class Ellipse():
-    nrPoints = 1000 #used for piecewise linear circumference calculation (ellipse circumference is tricky to calculate)
-    # approximate circumfere: c = pi * (3 * (a + b) - sqrt(10 * a * b + 3 * (a ** 2 + b ** 2)))
-
-    def __init__(self, w, h):
-        self.h = h
-        self.w = w
-        EllipsePoint = namedtuple('EllipsePoint', 'angle coord cDist')
-        self.ellData = [EllipsePoint(0, Coordinate(w/2, 0), 0)] # (angle, x, y, cumulative distance from angle = 0)
-        angle = 0
-        self.angleStep = 2 * pi / self.nrPoints
-        #note: the render angle (ra) corresponds to the angle from the ellipse center (ca) according to:
-        # ca = atan(w/h * tan(ra))
-        for i in range(self.nrPoints):
-            angle += self.angleStep
-            prev = self.ellData[-1]
-            x, y = w / 2 * cos(angle), h / 2 * sin(angle)
-            self.ellData.append(EllipsePoint(angle, Coordinate(x, y), prev.cDist + hypot(prev.coord.x - x, prev.coord.y - y)))
-        self.circumference = self.ellData[-1].cDist
-        #inkex.debug("circ: %d" % self.circumference)
-
-    def rAngle(self, a):
-        """Convert an angle measured from ellipse center to the angle used to generate ellData (used for lookups)"""
-        cf = 0
-        if a > pi / 2:
-            cf = pi
-        if a > 3 * pi / 2:
-            cf = 2 * pi
-        return atan(self.w / self.h * tan(a)) + cf
-
-    def coordinateFromAngle(self, angle):
-        """Coordinate of the point at angle."""
-        return Coordinate(self.w / 2 * cos(angle), self.h / 2 * sin(angle))
-
-    def notchCoordinate(self, angle, notchHeight):
-        """Coordinate for a notch at the given angle. The notch is perpendicular to the ellipse."""
-        angle %= (2 * pi)
-        #some special cases to avoid divide by zero:
-        if angle == 0:
-            return (0, Coordinate(self.w / 2 + notchHeight, 0))
-        elif angle == pi:
-            return (pi, Coordinate(-self.w / 2 - notchHeight, 0))
-        elif angle == pi / 2:
-            return(pi / 2, doc.Coordinate(0, self.h / 2 + notchHeight))
-        elif angle == 3 * pi / 2:
-            return(3 * pi / 2, Coordinate(0, -self.h / 2 - notchHeight))
-
-        x = self.w / 2 * cos(angle)
-        derivative = self.h / self.w * -x / sqrt((self.w / 2) ** 2 - x ** 2)
-        if angle > pi:
-            derivative = -derivative
-
-        normal = -1 / derivative
-        nAngle = atan(normal)
-        if angle > pi / 2 and angle < 3 * pi / 2:
-            nAngle += pi
-
-        nCoordinate = self.coordinateFromAngle(angle) + Coordinate(cos(nAngle), sin(nAngle)) * notchHeight
-        return nCoordinate
-
-
-    def distFromAngles(self, a1, a2):
-        """Distance accross the surface from point at angle a2 to point at angle a2. Measured in CCW sense."""
-        i1 = int(self.rAngle(a1) / self.angleStep)
-        p1 = self.rAngle(a1) % self.angleStep
-        l1 = self.ellData[i1 + 1].cDist - self.ellData[i1].cDist
-        i2 = int(self.rAngle(a2) / self.angleStep)
-        p2 = self.rAngle(a2) % self.angleStep
-        l2 = self.ellData[i2 + 1].cDist - self.ellData[i2].cDist
-        if a1 <= a2:
-            len = self.ellData[i2].cDist - self.ellData[i1].cDist + l2 * p2 - l1 * p1
-        else:
-            len = self.circumference + self.ellData[i2].cDist - self.ellData[i1].cDist
-        return len
-
-    def angleFromDist(self, startAngle, relDist):
-        """Returns the angle that you get when starting at startAngle and moving a distance (dist) in CCW direction"""
-        si = int(self.rAngle(startAngle) / self.angleStep)
-        p = self.rAngle(startAngle) % self.angleStep
-
-        l = self.ellData[si + 1].cDist - self.ellData[si].cDist
-
-        startDist = self.ellData[si].cDist + p * l
-
-        absDist = relDist + startDist
-
-        if absDist > self.ellData[-1].cDist:  # wrap around zero angle
-            absDist -= self.ellData[-1].cDist
-
-        iMin = 0
-        iMax = self.nrPoints
-        count = 0
-        while iMax - iMin > 1:  # binary search
-            count += 1
-            iHalf = iMin + (iMax - iMin) // 2
-            if self.ellData[iHalf].cDist < absDist:
-                iMin = iHalf
+                if command != upper:
+                    values = [v + (cx if k == 'x' else cy if k == 'y' else 0) for v, k in zip(values, kinds)]
+                cx = values[kinds.rindex('x')] if 'x' in kinds else cx
+                cy = values[kinds.rindex('y')] if 'y' in kinds else cy
+                if upper == 'M':
+                    sx, sy = cx, cy
+            yield upper, values
+
+    def simplify(self, tolerance=0, precision=None):
+        """New, absolute PathBuffer for the same outline with redundant nodes removed.
+
+        Operands are rounded to precision decimals first. Consecutive lines become one polyline
+        that is simplified with Ramer-Douglas-Peucker within tolerance, which also merges
+        duplicate and collinear nodes; a last line to the start of a closed subpath is left
+        to the close command and a move that is directly followed by another move is dropped.
+        Write the result with mode='shortest' to also get h and v commands where possible.
+        """
+        rnd = (lambda v : v) if precision is None else (lambda v : round(v, precision))
+        result = self.__class__()
+        xs, ys = [], []     # the current polyline, starting at the current point
+        cx = cy = sx = sy = 0.0
+        for command, values in self.iter_absolute():
+            values = [rnd(v) for v in values]
+            if command in 'LHV':
+                if not xs:
+                    xs.append(cx)
+                    ys.append(cy)
+                cx = values[0] if command != 'V' else cx
+                cy = values[-1] if command != 'H' else cy
+                xs.append(cx)
+                ys.append(cy)
+                continue
+            if command == 'Z' and len(xs) > 2 and xs[-1] == sx and ys[-1] == sy:
+                xs.pop()
+                ys.pop()
+            if xs:
+                for i in _polyline_keep(xs, ys, tolerance)[1:]:
+                    result._add('l', True, xs[i], ys[i])
+                xs, ys = [], []
+            if command == 'M' and result.commands and result.commands[-1] == 'M':
+                result.remove_last()
+            result._add(command, True, *values)
+            if command == 'Z':
+                cx, cy = sx, sy
             else:
-                iMax = iHalf
-
-        stepDist = self.ellData[iMax].cDist - self.ellData[iMin].cDist
-        return self.ellData[iMin].angle + self.angleStep * (absDist - self.ellData[iMin].cDist)/stepDist
+                cx, cy = values[-2], values[-1]
+                if command == 'M':
+                    sx, sy = cx, cy
+        if xs:
+            for i in _polyline_keep(xs, ys, tolerance)[1:]:
+                result._add('l', True, xs[i], ys[i])
+        return result
+
+    def reversed(self):
+        """New, absolute PathBuffer that traces the same outline in the opposite direction.
+
+        Subpaths are reversed and written in reverse order. Horizontal and vertical lines become
+        lines, smooth curves become full curves and closed subpaths stay closed.
+        """
+        subpaths = []   # [start, [(command, operands, from point)], closed]
+        cx = cy = 0.0
+        previous = None
+        for command, values in self.iter_absolute():
+            if command == 'M':
+                subpaths.append([(values[0], values[1]), [], False])
+                cx, cy = values
+                previous = None
+                continue
+            if not subpaths or subpaths[-1][2]:     # drawing after a close starts a new subpath there
+                subpaths.append([(cx, cy), [], False])
+            start, segments = subpaths[-1][0], subpaths[-1][1]
+            if command == 'Z':
+                if (cx, cy) != start:
+                    segments.append(('L', list(start), (cx, cy)))
+                subpaths[-1][2] = True
+                cx, cy = start
+                previous = None
+                continue
+            if command == 'H':
+                command, values = 'L', [values[0], cy]
+            elif command == 'V':
+                command, values = 'L', [cx, values[0]]
+            elif command == 'S':
+                c = previous[1][2:4] if previous and previous[0] == 'C' else (cx, cy)
+                command, values = 'C', [2 * cx - c[0], 2 * cy - c[1]] + values
+            elif command == 'T':
+                c = previous[1][0:2] if previous and previous[0] == 'Q' else (cx, cy)
+                command, values = 'Q', [2 * cx - c[0], 2 * cy - c[1]] + values
+            segments.append((command, values, (cx, cy)))
+            previous = (command, values)
+            cx, cy = values[-2], values[-1]
+        result = self.__class__()
+        for start, segments, closed in reversed(subpaths):
+            result._add('m', True, *(segments[-1][1][-2:] if segments else start))
+            for command, values, (x, y) in reversed(segments):
+                if command == 'L':
+                    result._add('l', True, x, y)
+                elif command == 'C':
+                    result._add('c', True, values[2], values[3], values[0], values[1], x, y)
+                elif command == 'Q':
+                    result._add('q', True, values[0], values[1], x, y)
+                else:
+                    result._add('a', True, values[0], values[1], values[2], values[3], 1 - values[4], x, y)
+            if closed:
+                result._add('z', True)
+        return result
+
+    def iter_d(self, precision=None, mode='keep', compact=False):
+        """Yield the d attribute in chunks.
+
+        mode is 'keep' (as recorded), 'absolute', 'relative' or 'shortest'; 'shortest' also writes
+        horizontal and vertical lines as h and v. Relative operands are computed from the rounded
+        output position, so rounding errors don't accumulate. With compact, repeated command
+        letters are left out.
+        """
+        rnd = (lambda v : v) if precision is None else (lambda v : round(v, precision))
+        # arc flags are written as 0 or 1, whatever the precision
+        fmt = lambda values, lower : ' '.join(str(int(v)) if lower == 'a' and k in (3, 4) else _format_number(v, precision) for k, v in enumerate(values))
+        cx = cy = sx = sy = 0.0     # current point and subpath start of the recorded path
+        ox = oy = osx = osy = 0.0   # the same for the path as it will be read back from the output
+        prev = None
+        i = 0
+        for command in self.commands:
+            lower = command.lower()
+            kinds = _PATH_OPERANDS[lower]
+            values = self.operands[i:i + len(kinds)]
+            i += len(kinds)
+            if lower == 'z':
+                cx, cy, ox, oy = sx, sy, osx, osy
+                letter, text = 'z', ''
+            else:
+                if command == lower:    # recorded as relative
+                    values = [v + (cx if k == 'x' else cy if k == 'y' else 0) for v, k in zip(values, kinds)]
+                if 'x' in kinds:
+                    cx = values[kinds.rindex('x')]
+                if 'y' in kinds:
+                    cy = values[kinds.rindex('y')]
+                if mode == 'shortest' and lower == 'l':
+                    if rnd(values[1]) == oy:
+                        lower, kinds, values = 'h', 'x', values[:1]
+                    elif rnd(values[0]) == ox:
+                        lower, kinds, values = 'v', 'y', values[1:]
+                absolute = [rnd(v) for v in values]
+                relative = [rnd(v - ox) if k == 'x' else rnd(v - oy) if k == 'y' else rnd(v) for v, k in zip(values, kinds)]
+                use_abs = (mode == 'absolute' or (mode == 'keep' and command != lower)) if mode != 'shortest' else None
+                if use_abs is None:
+                    abs_text, rel_text = fmt(absolute, lower), fmt(relative, lower)
+                    use_abs = len(abs_text) <= len(rel_text)
+                    text = abs_text if use_abs else rel_text
+                else:
+                    text = fmt(absolute if use_abs else relative, lower)
+                if use_abs:
+                    letter = lower.upper()
+                    ox = absolute[kinds.rindex('x')] if 'x' in kinds else ox
+                    oy = absolute[kinds.rindex('y')] if 'y' in kinds else oy
+                else:
+                    letter = lower
+                    ox = ox + relative[kinds.rindex('x')] if 'x' in kinds else ox
+                    oy = oy + relative[kinds.rindex('y')] if 'y' in kinds else oy
+                if lower == 'm':
+                    sx, sy, osx, osy = cx, cy, ox, oy
+            implicit = compact and letter == prev and lower != 'm' and lower != 'z'
+            chunk = text if implicit else (letter + ' ' + text if text else letter)
+            yield chunk if prev is None else ' ' + chunk
+            prev = {'m': 'l', 'M': 'L'}.get(letter, letter)     # coordinates following a move are line segments
+
+    def d(self, precision=None, mode='keep', compact=False):
+        """The d attribute as a string, see iter_d."""
+        key = (''.join(self.commands), _array_bytes(self.operands), precision, mode, compact)
+        return self.dCache.get(key, lambda : ''.join(self.iter_d(precision, mode, compact)))
+
+    def write(self, stream, precision=None, mode='keep', compact=False):
+        """Write the d attribute to a file-like object without building it in memory first."""
+        for chunk in self.iter_d(precision, mode, compact):
+            stream.write(chunk)
+
+    def path(self, parent, style, precision=None, mode='keep', compact=False, tolerance=None):
+        """Add the path to parent, simplified first when a tolerance is given."""
+        if _instrumentation is not None:
+            _instrumentation.count('PathBuffer.path')
+        buffer = self if tolerance is None else self.simplify(tolerance, precision)
+        attribs = {'style': style,
+                    'd': buffer.d(precision, mode, compact)}
+        return inkex.etree.SubElement(parent, inkex.addNS('path', 'svg'), attribs)
+
+def _toolpath_endpoints(element):
+    """(start, end, reversible) of a rect or path element, None for other and transformed elements."""
+    if element.get('transform'):
+        return None
+    if element.tag == inkex.addNS('rect', 'svg'):
+        corner = Coordinate(float(element.get('x', 0)), float(element.get('y', 0)))
+        return corner, corner, True
+    if element.tag != inkex.addNS('path', 'svg'):
+        return None
+    if element.get('d'):
+        start = None
+        cx = cy = sx = sy = 0.0
+        for command, values in iter_path_commands(element.get('d')):
+            if command == 'Z':
+                cx, cy = sx, sy
+                continue
+            cx, cy = (values[0], cy) if command == 'H' else (cx, values[0]) if command == 'V' else values[-2:]
+            if command == 'M':
+                sx, sy = cx, cy
+                if start is None:
+                    start = Coordinate(cx, cy)
+        return None if start is None else (start, Coordinate(cx, cy), True)
+    if element.get(inkex.addNS('type', 'sodipodi')) == 'arc':
+        cx, cy, rx, ry, a1, a2 = [float(element.get(inkex.addNS(name, 'sodipodi'))) for name in ('cx', 'cy', 'rx', 'ry', 'start', 'end')]
+        return Coordinate(cx + rx * cos(a1), cy + ry * sin(a1)), Coordinate(cx + rx * cos(a2), cy + ry * sin(a2)), False
+    return None
+
+def optimize_toolpaths(parent, reversible=True, origin=None, window=8, max_passes=3):
+    """Reorder the rect and path elements of parent (e.g. a layer) to reduce the travel between them.
+
+    The elements are ordered with order_toolpaths. With reversible, path elements may also be
+    reversed (elliptic arcs drawn by draw_ellipse never are). Other and transformed children keep
+    their position. Returns the ToolpathOrder, travel_before - travel_after is the travel saved.
+    """
+    slots, elements, starts, ends, flips = [], [], [], [], []
+    for index, element in enumerate(list(parent)):
+        endpoints = _toolpath_endpoints(element)
+        if endpoints is not None:
+            slots.append(index)
+            elements.append(element)
+            starts.append(endpoints[0])
+            ends.append(endpoints[1])
+            flips.append(reversible and endpoints[2])
+    result = order_toolpaths(starts, ends, flips, origin, window, max_passes)
+    for element in elements:
+        parent.remove(element)
+    for slot, i, rev in zip(slots, result.order, result.reversed):
+        element = elements[i]
+        if rev and not starts[i] == ends[i]:   # reversing a closed path changes nothing
+            element.set('d', PathBuffer.from_d(element.get('d')).reversed().d(mode='shortest', compact=True))
+        parent.insert(slot, element)
+    return result
+
+
+def simplify_d(d, tolerance=0, precision=3):
+    """Optimized version of the path data d: simplified (see PathBuffer.simplify), rounded to precision
+    decimals and written with the shortest commands."""
+    return PathBuffer.from_d(d).simplify(tolerance, precision).d(precision, 'shortest', True)
+
+
+def _path_buffers(result):
+    return [result] if isinstance(result, PathBuffer) else list(result)
+
+def _compute_geometry(job):
+    function, args = job
+    return _path_buffers(function(*args))
+
+def draw_layers(parent, jobs, processes=None, precision=None):
+    """Compute the paths of independent layers in worker processes and add them to parent.
+
+    jobs is a list of (layer_name, style, function, args) tuples. function(*args) must return a
+    PathBuffer or a list of them and, like function and args, must be picklable (so function
+    has to be defined at module level). It runs in a pool of processes (processes=None uses
+    all cores, 1 runs everything in this process); the lxml tree is only touched here, in the
+    order of jobs, so the output doesn't depend on which worker finishes first. A layer_name
+    of None creates a plain group. Returns the list of created layers.
+    """
+    work = [(function, args) for _, _, function, args in jobs]
+    if processes == 1 or len(work) < 2:
+        results = [_compute_geometry(job) for job in work]
+    else:
+        import multiprocessing
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(_compute_geometry, work)
+        finally:
+            pool.close()
+            pool.join()
+    layers = []
+    for (layer_name, style, _, _), buffers in zip(jobs, results):
+        container = group(parent) if layer_name is None else layer(parent, layer_name)
+        for buffer in buffers:
+            buffer.path(container, style, precision)
+        layers.append(container)
+    return layers
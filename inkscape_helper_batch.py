@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+"""Render an Effect for many option sets in one go.
+
+    python inkscape_helper_batch.py my_extension:MyEffect boxes.json --output-dir out
+
+The option sets are read from a JSON file (a list of objects) or a CSV file (one set per
+row, the header holds the option names). The template document (empty.svg by default) is
+parsed once per worker process and one SVG is written per option set.
+"""
+from __future__ import print_function
+import sys
+sys.path.append("C:\\Program Files\\Inkscape\\share\\extensions")
+sys.path.append("/usr/share/inkscape/extensions")
+
+import argparse
+import importlib
+import os
+
+from inkscape_helper import read_option_sets, run_batch
+
+EMPTY_SVG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'empty.svg')
+
+def load_effect(spec):
+    """The Effect class for 'module:Class'."""
+    module_name, _, class_name = spec.partition(':')
+    if not class_name:
+        raise ValueError("Effect should be given as module:Class, not {0!r}".format(spec))
+    return getattr(importlib.import_module(module_name), class_name)
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('effect', help='Effect class as module:Class')
+    parser.add_argument('option_sets', help='JSON or CSV file with the option sets')
+    parser.add_argument('--template', default=EMPTY_SVG, help='document to run the effect on (default: empty.svg)')
+    parser.add_argument('--output-dir', default='.', help='directory for the output SVGs')
+    parser.add_argument('--processes', type=int, default=None, help='number of worker processes (default: all cores)')
+    parser.add_argument('--name-field', default=None, help='option that holds the output file name (without .svg)')
+    options = parser.parse_args(args)
+
+    if not os.path.isdir(options.output_dir):
+        os.makedirs(options.output_dir)
+    written = run_batch(load_effect(options.effect), read_option_sets(options.option_sets), options.template,
+                        options.output_dir, options.processes, options.name_field)
+    for filename in written:
+        print(filename)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
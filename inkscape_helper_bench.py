@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+"""Benchmarks for the geometry and drawing hot paths of inkscape_helper.
+
+Runs offline against empty.svg and sweeps the input size of every benchmark. Results
+(throughput, peak memory and allocated memory blocks per operation) are printed as JSON
+and can be saved and compared against a previous run:
+
+    python inkscape_helper_bench.py --output baseline.json
+    python inkscape_helper_bench.py --baseline baseline.json
+"""
+from __future__ import division, print_function
+import sys
+sys.path.append("C:\\Program Files\\Inkscape\\share\\extensions")
+sys.path.append("/usr/share/inkscape/extensions")
+
+import argparse
+import gc
+import json
+import os
+import random
+import subprocess
+from timeit import default_timer as timer
+from collections import OrderedDict
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+from inkscape_helper import *
+
+EMPTY_SVG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'empty.svg')
+
+benchmarks = OrderedDict()
+
+def benchmark(name, sizes):
+    """Register a benchmark. The decorated function takes a size and returns the operation to time."""
+    def register(setup):
+        benchmarks[name] = (setup, sizes)
+        return setup
+    return register
+
+
+def _document():
+    effect = Effect()
+    effect.affect([EMPTY_SVG], False)
+    return effect.document.getroot()
+
+def _random_segments(n, seed=1):
+    rnd = random.Random(seed)
+    extent = 10 * sqrt(n)
+    segments = []
+    for i in range(n):
+        x, y, a = rnd.uniform(0, extent), rnd.uniform(0, extent), rnd.uniform(0, 2 * pi)
+        segments.append((Coordinate(x, y), Coordinate(x + 10 * cos(a), y + 10 * sin(a))))
+    return segments
+
+def _random_curves(n, seed=1):
+    rnd = random.Random(seed)
+    return [[Coordinate(rnd.uniform(0, 100), rnd.uniform(0, 100)) for j in range(4)] for i in range(n)]
+
+
+@benchmark('Ellipse.__init__', [(10, 5), (100, 60), (1000, 600)])
+def ellipse_init(size):
+    w, h = size
+    def run():
+        Ellipse.tableCache.clear()
+        Ellipse(w, h)
+    return run, 1
+
+@benchmark('Ellipse.__init__ (cached)', [(100, 60)])
+def ellipse_init_cached(size):
+    w, h = size
+    Ellipse(w, h)
+    return lambda : Ellipse(w, h), 1
+
+@benchmark('Ellipse.angleFromDist', [10, 100, 1000])
+def ellipse_angle_from_dist(n):
+    ell = Ellipse(100, 60)
+    step = ell.circumference / n
+    def run():
+        for i in range(n):
+            ell.angleFromDist(0, i * step)
+    return run, n
+
+@benchmark('Ellipse.anglesFromDists', [10, 100, 1000])
+def ellipse_angles_from_dists(n):
+    ell = Ellipse(100, 60)
+    dists = [i * ell.circumference / n for i in range(n)]
+    return lambda : ell.anglesFromDists(0, dists), n
+
+@benchmark('BezierCurve.subdivide', [10, 100, 1000])
+def bezier_subdivide(n):
+    curves = _random_curves(n)
+    def run():
+        for P in curves:
+            BezierCurve(P).subdivide(5)
+    return run, n
+
+@benchmark('intersection', [100, 1000, 10000])
+def intersection_pairs(n):
+    segments = _random_segments(2 * n)
+    pairs = list(zip(segments[::2], segments[1::2]))
+    def run():
+        for (s1, e1), (s2, e2) in pairs:
+            try:
+                intersection(s1, e1, s2, e2)
+            except IntersectionError:
+                pass
+    return run, n
+
+@benchmark('segment_intersections', [100, 1000, 10000])
+def bulk_intersections(n):
+    segments = _random_segments(n)
+    return lambda : segment_intersections(segments), n
+
+@benchmark('order_toolpaths', [1000, 10000, 100000])
+def toolpath_ordering(n):
+    segments = _random_segments(n)
+    starts = [s for s, e in segments]
+    ends = [e for s, e in segments]
+    return lambda : order_toolpaths(starts, ends), n
+
+@benchmark('offset_path', [100, 1000])
+def finger_joint_offset(n):
+    """Kerf compensation of a box side with n fingers."""
+    points = [Coordinate(0, 0)]
+    for i in range(n):
+        x = 10 * i
+        points.extend([Coordinate(x + 5, 0), Coordinate(x + 5, 3), Coordinate(x + 10, 3), Coordinate(x + 10, 0)])
+    points.extend([Coordinate(10 * n + 5, 0), Coordinate(10 * n + 5, 50), Coordinate(0, 50)])
+    side = CompositePath([Line(a, b) for a, b in zip(points, points[1:] + points[:1])], True)
+    return lambda : offset_path(side, 0.1), n
+
+@benchmark('hatch', [100, 1000, 10000])
+def hatch_fill(n):
+    """Dense fill of a star shaped outline with n points."""
+    rnd = random.Random(1)
+    angles = sorted(rnd.uniform(0, 2 * pi) for i in range(n))
+    radii = [rnd.uniform(50, 100) for i in range(n)]
+    outline = CoordinateArray([r * cos(a) for r, a in zip(radii, angles)], [r * sin(a) for r, a in zip(radii, angles)])
+    return lambda : hatch(outline, 0.2, pi / 4), n
+
+@benchmark('Path.path', [1000, 10000, 100000])
+def path_serialization(n):
+    root = _document()
+    def run():
+        p = Path()
+        p.move_to(Coordinate(0, 0), True)
+        for i in range(n):
+            p.line_to(Coordinate(1.5, (-1) ** i * 0.25))
+        p.path(root, default_style)
+        root.remove(root[-1])
+    return run, n
+
+@benchmark('startup', ['python', 'import inkscape_geometry', 'import inkscape_helper', 'Effect.affect'])
+def startup(what):
+    """Wall time of a fresh interpreter that only does what, like Inkscape's per-run extension process."""
+    code = {'python': 'pass',
+            'import inkscape_geometry': 'import inkscape_geometry',
+            'import inkscape_helper': 'import inkscape_helper',
+            'Effect.affect': 'import inkscape_helper; inkscape_helper.Effect().affect([{0!r}], False)'.format(EMPTY_SVG)}[what]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in sys.path if p))
+    command = [sys.executable, '-c', code]
+    return lambda : subprocess.check_call(command, env=env, cwd=os.path.dirname(EMPTY_SVG)), 1
+
+
+def measure(run, ops, repeat):
+    """Best wall time, peak memory and allocated blocks per operation of run."""
+    gc.collect()
+    best = float('inf')
+    for i in range(repeat):
+        start = timer()
+        run()
+        best = min(best, timer() - start)
+    peak = blocks = None
+    if tracemalloc is not None:
+        gc.collect()
+        before = sys.getallocatedblocks()
+        tracemalloc.start()
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        blocks = (sys.getallocatedblocks() - before) / ops
+    return OrderedDict([('seconds', best), ('ops_per_second', ops / best if best > 0 else None),
+                        ('peak_memory_bytes', peak), ('allocated_blocks_per_op', blocks)])
+
+def run_benchmarks(names=None, repeat=3):
+    results = OrderedDict()
+    for name, (setup, sizes) in benchmarks.items():
+        if names and not any(n in name for n in names):
+            continue
+        for size in sizes:
+            run, ops = setup(size)
+            results['{0} [{1}]'.format(name, size)] = measure(run, ops, repeat)
+    return results
+
+def compare(results, baseline, threshold):
+    """Print the change in throughput per benchmark. Returns the keys that got slower than threshold."""
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline or not baseline[key]['ops_per_second']:
+            continue
+        ratio = result['ops_per_second'] / baseline[key]['ops_per_second']
+        print('{0:50} {1:8.2f}x'.format(key, ratio), file=sys.stderr)
+        if ratio < 1 - threshold:
+            regressions.append(key)
+    return regressions
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('names', nargs='*', help='only run benchmarks whose name contains one of these')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timed runs, the best one is reported')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare the results against this JSON file')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative slowdown that counts as a regression')
+    options = parser.parse_args(args)
+
+    results = run_benchmarks(options.names, options.repeat)
+    json.dump(results, sys.stdout, indent=2)
+    print()
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if options.baseline:
+        with open(options.baseline) as f:
+            regressions = compare(results, json.load(f), options.threshold)
+        if regressions:
+            print('Regressions: ' + ', '.join(regressions), file=sys.stderr)
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,6 +3,7 @@ sys.path.append("C:\\Program Files\\Inkscape\\share\\extensions")
 sys.path.append("/usr/share/inkscape/extensions")
 
 import unittest
+from contextlib import contextmanager
 from inkscape_helper import *
 
 C00 = Coordinate(0, 0)
@@ -11,6 +12,17 @@ C01 = Coordinate(0, 1)
 C11 = Coordinate(1, 1)
 
 
+def square_paths(size, count):
+    paths = []
+    for i in range(count):
+        p = PathBuffer()
+        p.move_to(Coordinate(i, i), True)
+        p.lines_to([Coordinate(size, 0), Coordinate(0, size), Coordinate(-size, 0)])
+        p.close()
+        paths.append(p)
+    return paths
+
+
 class TestIntersection(unittest.TestCase):
 
     def test_on_segment(self):
@@ -33,6 +45,36 @@ class TestIntersection(unittest.TestCase):
     def test_in_segment_intersection(self):
         self.assertEqual(intersection(C00, C11, C10, C01), Coordinate(.5, .5))
 
+    def test_intersect(self):
+        self.assertEqual(intersect(C00, C11, C10, C01), (INTERSECTS, Coordinate(.5, .5)))
+        self.assertEqual(intersect(C00, C01, C10, C11), (PARALLEL, None))
+        self.assertEqual(intersect(C01, C01 * 2, C10, C10 * 2), (OFF_SEGMENT, C00))
+        self.assertEqual(intersect(C01, C01 * 2, C10, C10 * 2, False), (INTERSECTS, C00))
+
+    def test_intersect_many(self):
+        statuses, points = intersect_many([C00, C00, C01], [C11, C01, C01 * 2], [C10, C10, C10], [C01, C11, C10 * 2])
+        self.assertEqual(statuses, [INTERSECTS, PARALLEL, OFF_SEGMENT])
+        self.assertEqual(points[0], Coordinate(.5, .5))
+        self.assertTrue(isnan(points[1].x))
+        self.assertEqual(points[2], C00)
+
+    def test_segment_intersections(self):
+        segments = [(C00, C11), (C10, C01), (C11, C10 * 2), (C01 * 2, C11 * 2)]
+        found = segment_intersections(segments)
+        self.assertEqual([(i, j) for i, j, pt in found], [(0, 1), (0, 2)])
+        self.assertEqual(found[0][2], Coordinate(.5, .5))
+        self.assertEqual(found[1][2], C11, 'touching end points intersect')
+        others = segment_intersections([Line(C00, C11)], [(C10, C01), (C00, C01), (C01, C11)])
+        self.assertEqual([(i, j) for i, j, pt in others], [(0, 0), (0, 1), (0, 2)])
+
+    def test_segment_index(self):
+        index = SegmentIndex([(C00, C11), (C01 * 5, C11 * 5)], cell_size=1)
+        self.assertEqual(index.query(C10, C01), [(0, Coordinate(.5, .5))])
+        self.assertEqual(index.query(C10 * 3, C10 * 4), [])
+        diagonal = SegmentIndex([(C00, C11 * 1000)], cell_size=1)
+        self.assertTrue(len(diagonal.cells) < 5 * 1000, 'only the cells along (or touched by) the segment')
+        self.assertEqual(diagonal.query(Coordinate(500, 499.5), Coordinate(499.5, 500)), [(0, Coordinate(499.75, 499.75))])
+
 
 class TestCoordinate(unittest.TestCase):
     def setUp(self):
@@ -41,6 +83,8 @@ class TestCoordinate(unittest.TestCase):
 
     def test_eq(self):
         self.assertEqual(Coordinate(1, 2), Coordinate(1, 2))
+        self.assertFalse(Coordinate(1, 2) != Coordinate(1, 2))
+        self.assertTrue(Coordinate(1, 2) != Coordinate(2, 1))
 
     def test_add(self):
         sum = self.CX + self.CY
@@ -69,6 +113,42 @@ class TestCoordinate(unittest.TestCase):
         self.assertEqual(C11.t, pi/4)
 
 
+class TestCoordinateArray(unittest.TestCase):
+    def setUp(self):
+        self.A = CoordinateArray([0, 1, 1], [0, 0, 1])
+
+    def test_index(self):
+        self.assertEqual(len(self.A), 3)
+        self.assertEqual(self.A[1], C10)
+        self.assertEqual(self.A[-1], C11)
+        self.assertEqual(list(self.A), [C00, C10, C11])
+
+    def test_arithmetic(self):
+        self.assertEqual(self.A + C11, CoordinateArray([1, 2, 2], [1, 1, 2]))
+        self.assertEqual(self.A - self.A, CoordinateArray([0, 0, 0], [0, 0, 0]))
+        self.assertEqual(self.A * 2, CoordinateArray([0, 2, 2], [0, 0, 2]))
+        self.assertEqual(list((self.A / 2).x), [0, .5, .5])
+
+    def test_polar(self):
+        self.assertEqual(list(self.A.r), [0, 1, sqrt(2)])
+        self.assertEqual(list(self.A.t), [0, 0, pi/4])
+
+    def test_rotate(self):
+        rotated = CoordinateArray([1], [0]).rotate(pi / 2)
+        self.assertAlmostEqual(rotated[0].x, 0)
+        self.assertAlmostEqual(rotated[0].y, 1)
+
+    def test_view(self):
+        view = self.A[1:]
+        self.assertEqual(list(view), [C10, C11])
+        view[0] = C01
+        self.assertEqual(self.A[1], C01, 'slices share storage')
+
+    def test_bezier(self):
+        cubic = BezierCurve(CoordinateArray([1, 1, 0, 0], [0, 1, 0, 1]))
+        self.assertEqual(cubic.pathpoint_at_t(1).coord, C01)
+
+
 class TestPath(unittest.TestCase, Effect):
     # def __init__(self, *args, **kwargs):
         # print args, kwargs
@@ -91,6 +171,187 @@ class TestPath(unittest.TestCase, Effect):
         #print(p_str, p.nodes)
         self.assertEqual(p.nodes, ['M {0} {1}'.format(0.0, 0.0), 'l {0} {1}'.format(1.0, 1.0)])
 
+    def test_batch_draw(self):
+        root = self.document.getroot()
+        starts = CoordinateArray([0, 1], [0, 1])
+        ends = CoordinateArray([1, 2], [0, 2])
+        self.assertEqual(len(draw_lines(root, starts, ends)), 2)
+        merged = draw_lines(root, starts, ends, merge=True)
+        self.assertEqual(len(merged), 1)
+        self.assertEqual(merged[0].get('d'), 'M 0.0,0.0 L 1.0,0.0 M 1.0,1.0 L 2.0,2.0')
+        rects = draw_rectangles(root, [(1, 2, 3, 4), (5, 6, 7, 8)])
+        self.assertEqual(rects[1].get('x'), '7')
+        texts = draw_texts(root, [C00, C11], ['a', 'b'])
+        self.assertEqual(texts[1].text, 'b')
+        ellipses = draw_ellipses(root, [(1, 2)], [C11])
+        self.assertEqual(len(ellipses), 1)
+
+    def test_buffer(self):
+        p = PathBuffer()
+        p.move_to(C00, True)
+        p.line_to(C11)
+        p.line_to(C11)
+        p.h_line_to(0.5, True)
+        p.close()
+        self.assertEqual(p.d(), 'M 0.0 0.0 l 1.0 1.0 l 1.0 1.0 H 0.5 z')
+        self.assertEqual(p.d(1, 'absolute'), 'M 0 0 L 1 1 L 2 2 H 0.5 z')
+        self.assertEqual(p.d(1, 'relative', True), 'm 0 0 1 1 1 1 h -1.5 z')
+        p.remove_last()
+        self.assertEqual(len(p), 4)
+        p.path(self.document.getroot(), default_style)
+
+    def test_buffer_rounding(self):
+        p = PathBuffer()
+        p.move_to(C00, True)
+        for i in range(10):
+            p.line_to(Coordinate(0.14, 0))
+        steps = [float(v) for v in p.d(1, 'relative', True).split()[3::2]]
+        self.assertAlmostEqual(sum(steps), 1.4, 9, 'no accumulated rounding error')
+
+    def test_buffer_arc(self):
+        p = PathBuffer()
+        p.move_to(C00, True)
+        p.arc_to(2, 3, 14, 14, absolute=True)
+        self.assertEqual(p.d(), 'M 0.0 0.0 A 2.0 3.0 0.0 0 1 14.0 14.0', 'flags are 0 or 1')
+
+    def test_simplify(self):
+        d = 'M 0,0 L 1,0 L 2,0 L 2,0 L 2.0004,1 L 2,2 L 0,2 L 0,0 Z M 5,5 M 6,6 L 8,6 L 7,6'
+        self.assertEqual(simplify_d(d, 0.001, 2), 'M 0 0 H 2 V 2 H 0 z M 6 6 H 8 7')
+        self.assertEqual(simplify_d(d, 0, 4), 'M 0 0 H 2 L 2.0004 1 2 2 H 0 z M 6 6 H 8 7', 'only exactly collinear nodes are merged')
+        polyline = simplify_polyline([C00, Coordinate(1, 0.05), Coordinate(2, 0), C11], 0.1)
+        self.assertEqual(list(polyline), [C00, Coordinate(2, 0), C11])
+        p = PathBuffer()
+        p.move_to(C00, True)
+        p.lines_to([C10, C10, C10, C01])
+        self.assertEqual(p.simplify().d(), 'M 0.0 0.0 L 3.0 0.0 L 3.0 1.0')
+
+    def test_reversed(self):
+        p = PathBuffer.from_d('M 0 0 H 2 V 2 z M 5 5 S 8 9 9 9 A 2 3 0 1 0 14 14')
+        self.assertEqual(p.reversed().d(0), 'M 14 14 A 2 3 0 1 1 9 9 C 8 9 5 5 5 5 M 0 0 L 2 2 L 2 0 L 0 0 z')
+        self.assertEqual(p.reversed().reversed().d(0), 'M 0 0 L 2 0 L 2 2 L 0 0 z M 5 5 C 5 5 8 9 9 9 A 2 3 0 1 0 14 14')
+
+    def test_order_toolpaths(self):
+        starts = [Coordinate(10, 0), Coordinate(1, 0), Coordinate(5, 0)]
+        ends = [Coordinate(11, 0), Coordinate(2, 0), Coordinate(4, 0)]
+        fixed = order_toolpaths(starts, ends, False)
+        self.assertEqual(fixed.order, [1, 2, 0])
+        self.assertEqual(fixed.reversed, [False] * 3)
+        self.assertAlmostEqual(fixed.travel_before, 10 + 10 + 3)
+        self.assertAlmostEqual(fixed.travel_after, 1 + 3 + 6)
+        free = order_toolpaths(starts, ends)
+        self.assertEqual((free.order, free.reversed), ([1, 2, 0], [False, True, False]))
+        self.assertAlmostEqual(free.travel_after, 1 + 2 + 5)
+
+    def test_optimize_toolpaths(self):
+        parent = group(self.document.getroot())
+        draw_line(parent, Coordinate(10, 0), Coordinate(11, 0))
+        draw_text(parent, C00, 'label')
+        draw_line(parent, Coordinate(5, 0), Coordinate(1, 0))
+        result = optimize_toolpaths(parent)
+        self.assertTrue(result.travel_after < result.travel_before)
+        self.assertEqual(parent[1].tag, inkex.addNS('text', 'svg'), 'other elements keep their place')
+        self.assertEqual(parent[0].get('d'), 'M 1.0 0.0 H 5.0')
+        self.assertEqual(parent[2].get('d'), 'M 10.0,0.0 L 11.0,0.0')
+
+    def test_draw_layers(self):
+        jobs = [('cut', default_style, square_paths, (10, 3)), (None, groove_style, square_paths, (5, 2))]
+        root = self.document.getroot()
+        serial = draw_layers(root, jobs, 1)
+        parallel = draw_layers(root, jobs, 2)
+        self.assertEqual([len(l) for l in parallel], [3, 2])
+        self.assertEqual(parallel[0].get(inkex.addNS('label', 'inkscape')), 'cut')
+        for a, b in zip(serial, parallel):
+            self.assertEqual([p.get('d') for p in a], [p.get('d') for p in b], 'same paths in the same order')
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    class LineEffect(Effect):
+        def effect(self):
+            with phase('lines'):
+                for i in range(3):
+                    draw_line(self.document.getroot(), C00, C11)
+
+    def test_report(self):
+        import json, os, tempfile
+        report_file = os.path.join(tempfile.mkdtemp(), 'report.json')
+        self.LineEffect().affect(['--instrument=' + report_file, 'empty.svg'], False)
+        with open(report_file) as f:
+            report = json.load(f)
+        self.assertEqual(report['counts'], {'draw_line': 3})
+        self.assertEqual(report['phases']['lines']['calls'], 1)
+        self.assertTrue('parse' in report['phases'])
+
+
+class BoxEffect(Effect):
+    def __init__(self):
+        Effect.__init__(self, [('width', 'float', 10, 'box width')])
+
+    def effect(self):
+        draw_rectangle(self.document.getroot(), self.options.width, 5, 0, 0)
+
+
+class TestBatch(unittest.TestCase):
+
+    def test_run_batch(self):
+        import os, tempfile
+        output_dir = tempfile.mkdtemp()
+        written = run_batch(BoxEffect, [{'width': 3, 'name': 'small'}, {'width': 7, 'name': 'large'}], 'empty.svg', output_dir, 1, 'name')
+        self.assertEqual(written, [os.path.join(output_dir, 'small.svg'), os.path.join(output_dir, 'large.svg')])
+        with open(written[1]) as f:
+            self.assertTrue('width="7' in f.read())
+        with open(written[0]) as f:
+            self.assertFalse('width="7' in f.read(), 'every run starts from the template')
+
+    def test_run_batch_processes(self):
+        import os, tempfile
+        output_dir = tempfile.mkdtemp()
+        written = run_batch(BoxEffect, [{'width': 3}, {'width': 7}], 'empty.svg', output_dir, 2)
+        self.assertEqual(written, [os.path.join(output_dir, '0000.svg'), os.path.join(output_dir, '0001.svg')])
+        with open(written[1]) as f:
+            self.assertTrue('width="7' in f.read())
+
+    def test_run_batch_options(self):
+        import json, os, tempfile
+        output_dir = tempfile.mkdtemp()
+        report_file = os.path.join(output_dir, 'report.json')
+        cache_dir = os.path.join(output_dir, 'cache')
+        run_batch(BoxEffect, [{'width': 3, 'instrument': report_file, 'cache_dir': cache_dir}], 'empty.svg', output_dir, 1)
+        with open(report_file) as f:
+            self.assertEqual(json.load(f)['counts'], {'draw_rectangle': 1})
+        self.assertTrue(os.path.isdir(cache_dir))
+        self.assertEqual(GeometryCache.directory, None, 'the cache directory only applies to its option set')
+
+
+class LayersEffect(Effect):
+    streaming = False
+
+    def effect(self):
+        root = self.document.getroot()
+        draw_text(root, C00, 'title')
+        for name, style in [('cut', default_style), ('groove', groove_style)]:
+            with self.stream_layer(name) if self.streaming else _tree_layer(root, name) as l:
+                draw_lines(l, [C00, C10], [C11, C01], style)
+                draw_rectangle(l, 2, 3, 4, 5, style=style)
+
+@contextmanager
+def _tree_layer(root, name):
+    yield layer(root, name)
+
+
+class TestStreaming(unittest.TestCase):
+
+    def test_byte_identical(self):
+        import io
+        tree = LayersEffect()
+        tree.affect(['empty.svg'], False)
+        streamed = LayersEffect()
+        streamed.streaming = True
+        streamed.stream_file = io.BytesIO()
+        streamed.affect(['empty.svg'])
+        self.assertEqual(streamed.stream_file.getvalue(), inkex.etree.tostring(tree.document))
+        self.assertEqual(len(streamed.document.getroot()), len(tree.document.getroot()) - 2, 'layers are not kept')
+
 
 class TestPathSegment(unittest.TestCase, Effect):
     #def setUp(self):
@@ -125,12 +386,260 @@ class TestPathSegment(unittest.TestCase, Effect):
         threeparts, rest = cubic.subdivide(sqrt(2))
         self.assertEqual(threeparts[1].coord, C11, 'subdivide cubic bezier in three parts')
 
+    def test_bezier_evaluate(self):
+        cubic = BezierCurve([C10, C11, C00, C01])
+        pts = cubic.evaluate([0, 0.25, 1])
+        self.assertEqual(Coordinate(pts.x[0], pts.y[0]), C10, 'start point')
+        self.assertEqual(Coordinate(pts.x[2], pts.y[2]), C01, 'end point')
+        single = cubic.pathpoint_at_t(0.25)
+        self.assertEqual(Coordinate(pts.x[1], pts.y[1]), single.coord, 'batched point matches single point')
+        self.assertEqual(pts.curvature[1], single.curvature, 'batched curvature matches single curvature')
+        self.assertEqual(pts.c_dist[2], cubic.length, 'distance at end point')
+        line = BezierCurve([C00, C10, C10 * 2])
+        both = evaluate_beziers([cubic, line], [0.5])
+        self.assertEqual(Coordinate(both[1].x[0], both[1].y[0]), C10, 'midpoint of second curve')
+
+    def test_curvature_subdivide(self):
+        line = Line(C00, C10 * 10)
+        points = line.subdivide_curvature(0.1, max_length=3)
+        self.assertEqual([p.coord.x for p in points], [0, 2.5, 5, 7.5, 10], 'straight lines only split by length')
+        hairpin = BezierCurve([C00, C10 * 100, Coordinate(100, 5), C01 * 5])
+        points = hairpin.subdivide_curvature(0.05)
+        self.assertEqual(points[0].coord, C00, 'start point')
+        self.assertEqual(points[-1].coord, C01 * 5, 'end point')
+        gaps = [(q.coord - p.coord).r for p, q in zip(points, points[1:])]
+        self.assertTrue(min(gaps) < max(gaps) / 10, 'denser where the curvature is high')
+        self.assertTrue(len(hairpin.subdivide_curvature(0.05, thickness=0.05)) > len(points), 'thickness increases the density')
+        self.assertRaises(ValueError, EllipticArc(C00, 1, 1, 0, pi).subdivide_curvature, 0.05, thickness=1)
+
+    def test_elliptic_arc(self):
+        quarter = EllipticArc(C00, 1, 1, 0, pi / 2)
+        self.assertAlmostEqual(quarter.length, pi / 2)
+        self.assertAlmostEqual(quarter.t_at_length(pi / 4), 0.5)
+        mid = quarter.evaluate([0.5])
+        self.assertAlmostEqual(mid.x[0], sqrt(.5))
+        self.assertAlmostEqual(mid.curvature[0], 1)
+        clockwise = EllipticArc(C00, 2, 1, pi, -pi)
+        self.assertAlmostEqual(clockwise.evaluate([0.5]).x[0], 2)
+        self.assertAlmostEqual(clockwise.evaluate([0.5]).curvature[0], -2)
+
+    def test_composite_path(self):
+        path = CompositePath([Line(C00, C10 * 10), EllipticArc(Coordinate(10, 5), 5, 5, -pi / 2, pi / 2), Line(Coordinate(10, 10), C01 * 10)])
+        self.assertAlmostEqual(path.length, 20 + 5 * pi)
+        self.assertEqual(path.segment_at_distance(12), 1)
+        top = path.point_at_distance(10 + 2.5 * pi)
+        self.assertAlmostEqual(top.coord.x, 15)
+        self.assertAlmostEqual(top.coord.y, 5)
+        self.assertAlmostEqual(top.c_dist, 10 + 2.5 * pi)
+        points, rest = path.subdivide(5)
+        self.assertEqual(len(points), 8)
+        self.assertAlmostEqual(points[-1].coord.x, 10 - (35 - 10 - 5 * pi))
+        self.assertAlmostEqual(rest, 20 + 5 * pi - 35)
+
+    def test_bezier_tolerance(self):
+        cubic = BezierCurve([C00, C01, C11, C10])
+        coarse = BezierCurve([C00, C01, C11, C10], tolerance=1e-2)
+        fine = BezierCurve([C00, C01, C11, C10], tolerance=1e-6)
+        self.assertTrue(fine.length_error <= 1e-6, 'length error within tolerance')
+        self.assertTrue(len(coarse.ts) < len(fine.ts), 'less samples for a larger tolerance')
+        self.assertTrue(abs(fine.length - coarse.length) <= 1e-2, 'lengths agree within tolerance')
+        self.assertTrue(cubic.length < fine.length, 'polyline is shorter than the curve')
+        self.assertAlmostEqual(fine.t_at_length(fine.length / 2), 0.5, 6, 'symmetric curve midpoint')
+
+
+class TestPathParser(unittest.TestCase):
+
+    def test_commands(self):
+        commands = list(iter_path_commands('m 1 2 3 4 h 1 V 0 z l 1 1'))
+        self.assertEqual(commands, [('M', [1, 2]), ('L', [4, 6]), ('H', [5]), ('V', [0]), ('Z', []), ('L', [2, 3])])
+
+    def test_segments(self):
+        square, open_path = parse_path('M10,10 h 10 v10 h-10z m 30 0 l5 5 5-5')
+        self.assertTrue(square.closed)
+        self.assertEqual(len(square), 4)
+        self.assertEqual(square.length, 40)
+        self.assertFalse(open_path.closed)
+        self.assertEqual(open_path.segments[0].start, Coordinate(40, 10))
+        curves = parse_path('M0 0 C 0 10 10 10 10 0 S 20 -10 20 0 Q 25 5 30 0 T 40 0')[0]
+        self.assertEqual([s.order for s in curves], [3, 3, 2, 2])
+        self.assertEqual(curves.segments[1].P[1], Coordinate(10, -10), 'reflected control point')
+        self.assertEqual(curves.segments[3].P[1], Coordinate(35, -5), 'reflected control point')
+
+    def test_arc(self):
+        arc = parse_path('M 0 0 A 10 10 0 0 1 20 0')[0].segments[0]
+        self.assertAlmostEqual(arc.length, 10 * pi)
+        self.assertAlmostEqual(arc.evaluate([0.5]).y[0], -10)
+        arc = parse_path('M0 0a10 5 30 1 0 10 10')[0].segments[0]
+        end = arc.evaluate([1])
+        self.assertAlmostEqual(end.x[0], 10)
+        self.assertAlmostEqual(end.y[0], 10)
+
+    def test_points(self):
+        points = parse_path_points('M.5.5-1e1,2z')
+        self.assertEqual(points, [CoordinateArray([.5, -10], [.5, 2])])
+        points = parse_path_points('M0 0 10 0 10 10z l0 5')
+        self.assertEqual(points[1], CoordinateArray([0, 0], [0, 5]), 'drawing after a close starts at the subpath start')
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, parse_path, 'M 0 0 L 1')
+
+
+class TestEllipse(unittest.TestCase):
+
+    def test_circumference(self):
+        circle = Ellipse(2, 2, tolerance=1e-6)
+        self.assertTrue(abs(circle.circumference - 2 * pi) <= 1e-6, 'circle circumference')
+        self.assertTrue(circle.lengthError <= 1e-6, 'length error within tolerance')
+
+    def test_dist_angle_roundtrip(self):
+        ell = Ellipse(100, 60, tolerance=1e-6)
+        self.assertAlmostEqual(ell.distFromAngles(0, pi), ell.circumference / 2, 5)
+        self.assertAlmostEqual(ell.angleFromDist(0, ell.circumference / 4), pi / 2, 5)
+
+    def test_exact_arc_length(self):
+        circle = Ellipse(2, 2)
+        self.assertAlmostEqual(circle.arcLength(pi), pi, 12)
+        ell = Ellipse(100, 60)
+        self.assertAlmostEqual(ell.arcLength(2 * pi), 255.26998863398, 8)
+        self.assertAlmostEqual(Ellipse(60, 100).arcLength(2 * pi), ell.arcLength(2 * pi), 8)
+
+    def test_angles_from_dists(self):
+        ell = Ellipse(100, 60)
+        dists = [0, 10, 50, 128, 200]
+        angles = ell.anglesFromDists(0, dists)
+        for angle, dist in zip(angles, dists):
+            self.assertAlmostEqual(ell.arcLength(angle), dist, 9)
+        self.assertAlmostEqual(ell.anglesFromDists(0, [ell.arcLength(pi / 2)])[0], pi / 2, 12)
+
+    def test_notches(self):
+        ell = Ellipse(100, 60)
+        for angle, expected in [(0, (55, 0)), (pi / 2, (0, 35)), (pi, (-55, 0)), (3 * pi / 2, (0, -35))]:
+            notch = ell.notchCoordinate(angle, 5)
+            self.assertAlmostEqual(notch.x, expected[0])
+            self.assertAlmostEqual(notch.y, expected[1])
+        angles = [2 * pi * i / 100 for i in range(100)]
+        normals = ell.normalsFromAngles(angles)
+        notches = ell.notchCoordinates(angles, 5)
+        for angle, normal, notch in zip(angles, normals, notches):
+            offset = notch - ell.coordinateFromAngle(angle)
+            self.assertAlmostEqual(offset.r, 5)
+            self.assertAlmostEqual(normal.r, 1)
+            self.assertAlmostEqual(inner_product(normal, Coordinate(-50 * sin(angle), 30 * cos(angle))), 0, 12, 'perpendicular')
+        self.assertEqual([round(x, 9) for x in ell.notchCoordinates([0, pi], [1, -1]).x], [51, -49])
+
+    def test_table_cache(self):
+        Ellipse.tableCache.clear()
+        first = Ellipse(30, 20)
+        second = Ellipse(30, 20)
+        self.assertTrue(first.table is second.table, 'tables are shared')
+        self.assertEqual(Ellipse.cache_info().hits, 1)
+        self.assertEqual(Ellipse.cache_info().misses, 1)
+        self.assertEqual(len(first.ellData), Ellipse.nrPoints + 1)
+        self.assertAlmostEqual(first.ellData[Ellipse.nrPoints // 2].cDist, first.circumference / 2)
+
+
+def outline(*points):
+    cs = [Coordinate(x, y) for x, y in points]
+    return CompositePath([Line(a, b) for a, b in zip(cs, cs[1:] + cs[:1])], True)
+
+def area(coords):
+    xs, ys = list(coords.x), list(coords.y)
+    return sum(xs[k - 1] * ys[k] - xs[k] * ys[k - 1] for k in range(len(xs))) / 2
+
+
+class TestOffset(unittest.TestCase):
+
+    def test_corners(self):
+        l_shape = outline((0, 0), (10, 0), (10, 5), (5, 5), (5, 10), (0, 10))
+        self.assertAlmostEqual(area(offset_path(l_shape, 1)), 75 + 39 + 5, msg='grows with mitered corners')
+        self.assertAlmostEqual(area(offset_path(l_shape, 1, join='bevel')), 75 + 39 + 5 * 0.5)
+        self.assertAlmostEqual(area(offset_path(l_shape, 1, join='round', tolerance=1e-4)), 75 + 39 + 5 * pi / 4, 2)
+        shrunk = offset_path(l_shape, -1)
+        self.assertAlmostEqual(area(shrunk), 39, msg='the loop at the inner corner is removed')
+        self.assertTrue(Coordinate(4, 4) in list(shrunk))
+        reversed_l = outline((0, 10), (5, 10), (5, 5), (10, 5), (10, 0), (0, 0))
+        self.assertAlmostEqual(area(offset_path(reversed_l, -1)), -39, msg='independent of the direction')
+
+    def test_closing_gap(self):
+        slot = outline((0, 0), (10, 0), (10, 10), (6, 10), (6, 2), (4, 2), (4, 10), (0, 10))
+        self.assertAlmostEqual(area(offset_path(slot, 1.5)), 13 * 13)
+
+    def test_curves(self):
+        grown = offset_path(Ellipse(100, 60), 2, tolerance=1e-4)
+        self.assertAlmostEqual(max(grown.x), 52)
+        self.assertAlmostEqual(min(grown.y), -32)
+        self.assertAlmostEqual(area(grown), pi * 50 * 30 + Ellipse(100, 60).circumference * 2 + pi * 4, 0)
+        curve = offset_path(BezierCurve.quadratic(C00, Coordinate(1, 1), Coordinate(2, 0)), 0.1)
+        self.assertAlmostEqual(curve[0].y, 0.1 / sqrt(2))
+        self.assertAlmostEqual(curve[-1].x, 2 + 0.1 / sqrt(2), msg='open paths are offset to the left')
+
+
+class TestHatch(unittest.TestCase):
+
+    def test_polygons(self):
+        square = [C00, Coordinate(10, 0), Coordinate(10, 10), Coordinate(0, 10)]
+        starts, ends = hatch(square, 1, offset=0.5)
+        self.assertEqual(len(starts), 10)
+        self.assertEqual((starts[0], ends[0]), (Coordinate(0, 0.5), Coordinate(10, 0.5)))
+        hole = CoordinateArray([3, 7, 7, 3], [3, 3, 7, 7])
+        starts, ends = hatch([square, hole], 1, offset=0.5, alternate=True)
+        self.assertEqual(len(starts), 14, 'lines through the hole are split')
+        self.assertAlmostEqual(sum((e - s).r for s, e in zip(starts, ends)), 100 - 16)
+        self.assertEqual((starts[1], ends[1]), (Coordinate(10, 1.5), Coordinate(0, 1.5)))
+        diamond = [Coordinate(0, -1), Coordinate(1, 0), Coordinate(0, 1), Coordinate(-1, 0)]
+        starts, ends = hatch(diamond, 1)
+        self.assertEqual(len(starts), 1, 'a line through two vertices crosses the outline twice')
+
+    def test_curves(self):
+        starts, ends = hatch(Ellipse(100, 60), 0.1, pi / 6)
+        self.assertAlmostEqual(sum((e - s).r for s, e in zip(starts, ends)) * 0.1 / (pi * 50 * 30), 1, 3)
+        direction = ends[0] - starts[0]
+        self.assertAlmostEqual(direction.t, pi / 6)
+        starts, ends = hatch(parse_path('M 0,0 h 10 v 10 h -10 z')[0], 2, offset=1)
+        self.assertEqual(len(starts), 5)
+
+
+class TestGeometryCache(unittest.TestCase):
+
+    def test_disk_cache(self):
+        import tempfile
+        GeometryCache.directory = tempfile.mkdtemp()
+        try:
+            computed = []
+            compute = lambda : computed.append(1) or [1.5, 2.5]
+            self.assertEqual(GeometryCache('test').get(('a', 1.0), compute), [1.5, 2.5])
+            self.assertEqual(GeometryCache('test').get(('a', 1.0), compute), [1.5, 2.5], 'loaded by a new cache')
+            self.assertEqual(len(computed), 1)
+            GeometryCache('test').get(('a', 2.0), compute)
+            self.assertEqual(len(computed), 2, 'other inputs are computed')
+        finally:
+            GeometryCache.directory = None
+
+    def test_cached_geometry(self):
+        PathSegment.subdivisionCache.clear()
+        curve = BezierCurve.quadratic(C00, C10, C11)
+        self.assertTrue(BezierCurve.quadratic(C00, C10, C11).distances is curve.distances, 'tables are shared')
+        first = curve.subdivide_cached(0.1)
+        self.assertTrue(BezierCurve.quadratic(C00, C10, C11).subdivide_cached(0.1) is first)
+        self.assertEqual(PathSegment.subdivisionCache.info().hits, 1)
+        self.assertEqual(first[0], curve.subdivide(0.1)[0])
+        self.assertNotEqual(Line(C00, C11).cache_key(), Line(C00, C10).cache_key())
+
 coordinate_t = unittest.TestLoader().loadTestsFromTestCase(TestCoordinate)
+coordinate_array_t = unittest.TestLoader().loadTestsFromTestCase(TestCoordinateArray)
 intersection_t = unittest.TestLoader().loadTestsFromTestCase(TestIntersection)
 path_t = unittest.TestLoader().loadTestsFromTestCase(TestPath)
 segment_t = unittest.TestLoader().loadTestsFromTestCase(TestPathSegment)
+ellipse_t = unittest.TestLoader().loadTestsFromTestCase(TestEllipse)
+parser_t = unittest.TestLoader().loadTestsFromTestCase(TestPathParser)
+instrumentation_t = unittest.TestLoader().loadTestsFromTestCase(TestInstrumentation)
+batch_t = unittest.TestLoader().loadTestsFromTestCase(TestBatch)
+cache_t = unittest.TestLoader().loadTestsFromTestCase(TestGeometryCache)
+offset_t = unittest.TestLoader().loadTestsFromTestCase(TestOffset)
+streaming_t = unittest.TestLoader().loadTestsFromTestCase(TestStreaming)
+hatch_t = unittest.TestLoader().loadTestsFromTestCase(TestHatch)
 
 
-suite = unittest.TestSuite([coordinate_t, intersection_t, path_t, segment_t])
+suite = unittest.TestSuite([coordinate_t, coordinate_array_t, intersection_t, path_t, segment_t, ellipse_t, parser_t, instrumentation_t, batch_t, cache_t, offset_t, streaming_t, hatch_t])
 unittest.TextTestRunner(verbosity=2).run(suite)
 #    unittest.main()